@@ -1,19 +1,34 @@
 import asyncio
 import logging
 import os
-from contextlib import suppress
+import subprocess
+import sys
+import time
 
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 
 from config import settings
-from security.integrity import verify_project_integrity
-from security.memory_store import start_schedulers
+from db.migrations import run_migrations
+from security.hash_utils import shutdown_hash_executor
+from security.integrity import shutdown_integrity_watch, start_integrity_watch, verify_with_manifest
+from security.memory_store import close_memory_store, start_schedulers
+from services.client_pool import start_client_pool
+from services.expiry_sweeper import start_expiry_sweeper
+from services.metrics import start_metrics_server, stop_metrics_server
+from services.sender import notify_admins, start_sender, stop_sender
+from services.xui_client import close_xui_session
 
 from bot.routers.menu import router as menu_router
 from bot.routers.payment import router as payments_router
 from bot.routers.support import router as support_router
+from bot.middlewares import (
+    DbSessionMiddleware,
+    OverloadMiddleware,
+    UpdateMetricsMiddleware,
+    setup_handler_metrics,
+)
 
 
 logging.basicConfig(
@@ -23,6 +38,8 @@ logging.basicConfig(
 
 logger = logging.getLogger("kynix_bot")
 
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+
 
 async def notify_admins_integrity_failed(bot: Bot, current_hash: str, reason: str | None = None) -> None:
     text = (
@@ -32,24 +49,47 @@ async def notify_admins_integrity_failed(bot: Bot, current_hash: str, reason: st
     if reason:
         text += f"\nТекущий хэш: <code>{current_hash}</code>"
 
-    for admin_id in settings.ADMINS:
-        with suppress(Exception):
-            await bot.send_message(admin_id, text)
+    start_sender(bot)
+    notify_admins(text)
+    await stop_sender()
 
 
-async def main() -> None:
-    bot = Bot(
+def create_bot() -> Bot:
+    return Bot(
         token=settings.BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
 
+
+def build_dispatcher() -> Dispatcher:
     dp = Dispatcher()
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    dp.update.outer_middleware(OverloadMiddleware())
+    dp.update.outer_middleware(DbSessionMiddleware())
+
+    for router in (menu_router, payments_router, support_router):
+        setup_handler_metrics(router)
+        dp.include_router(router)
 
-    dp.include_router(menu_router)
-    dp.include_router(payments_router)
-    dp.include_router(support_router)
+    return dp
 
-    current_hash = verify_project_integrity(base_path=os.path.dirname(__file__))
+
+async def check_integrity(bot: Bot) -> bool:
+    report = await asyncio.to_thread(
+        verify_with_manifest,
+        BASE_PATH,
+        settings.INTEGRITY_MANIFEST_PATH,
+        settings.INTEGRITY_HASH_WORKERS,
+    )
+    current_hash = report.project_hash
+    if report.rehashed:
+        logger.info(
+            "Integrity: rehashed %s files (changed=%s added=%s removed=%s)",
+            report.rehashed,
+            len(report.changed),
+            len(report.added),
+            len(report.removed),
+        )
 
     code_hash = (settings.CODE_HASH or "").strip()
 
@@ -61,19 +101,164 @@ async def main() -> None:
             current_hash,
         )
         await notify_admins_integrity_failed(bot, current_hash, reason)
-        return
+        return False
 
     if current_hash != code_hash:
         reason = f"Integrity check failed. Expected {code_hash}, got {current_hash}"
         logger.error(reason)
         await notify_admins_integrity_failed(bot, current_hash, reason)
-        return
+        return False
+
+    return True
+
+
+async def start_services(
+    bot: Bot,
+    primary: bool = True,
+    send_rate: float | None = None,
+    metrics_port: int | None = None,
+) -> None:
+    metrics_port = settings.METRICS_PORT if metrics_port is None else metrics_port
+    if metrics_port:
+        await start_metrics_server(settings.METRICS_HOST, metrics_port)
 
     start_schedulers()
+    # фоновые задачи над общими БД/3x-ui нужны в одном экземпляре
+    if primary:
+        start_client_pool()
+        start_expiry_sweeper()
+        start_integrity_watch(
+            BASE_PATH,
+            (settings.CODE_HASH or "").strip(),
+            settings.INTEGRITY_MANIFEST_PATH,
+            settings.INTEGRITY_RECHECK_INTERVAL_SECONDS,
+        )
+    start_sender(bot, rate=send_rate)
+
+
+async def shutdown_services() -> None:
+    await stop_metrics_server()
+    await stop_sender()
+    await close_xui_session()
+    await close_memory_store()
+    shutdown_hash_executor()
+    shutdown_integrity_watch()
+
+
+async def main() -> None:
+    bot = create_bot()
+    dp = build_dispatcher()
+
+    if not await check_integrity(bot):
+        return
+
+    if settings.DB_MIGRATE_ON_STARTUP:
+        applied = await run_migrations()
+        if applied:
+            logger.info("Applied DB migrations: %s", applied)
+
+    # aiohttp.web и multiprocessing нужны только в своих режимах
+    if settings.WORKERS > 1:
+        from bot.workers import run_supervisor
+
+        logger.info("Bot started with %s workers", settings.WORKERS)
+        await run_supervisor(bot, dp)
+        return
+
+    await start_services(bot)
 
     logger.info("Bot started")
-    await dp.start_polling(bot)
+    try:
+        if settings.BOT_MODE == "webhook":
+            from bot.webhook import run_webhook
+
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await shutdown_services()
+
+
+# ============================
+# python app.py --startup-profile
+# ============================
+
+def _import_profile() -> list[tuple[str, int, int]]:
+    """(модуль, self мкс, cumulative мкс) для `import app` в чистом процессе."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=BASE_PATH,
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        rows.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+    return rows
+
+
+def _init_profile() -> list[tuple[str, float]]:
+    from db.base import get_engine
+    from security.memory_store import get_backend
+    from services.xui_client import get_xui_session
+
+    steps = [
+        ("create_bot", create_bot),
+        ("build_dispatcher", build_dispatcher),
+        ("db.base.get_engine", get_engine),
+        ("security.integrity.verify_with_manifest", lambda: verify_with_manifest(
+            BASE_PATH,
+            settings.INTEGRITY_MANIFEST_PATH,
+            settings.INTEGRITY_HASH_WORKERS,
+        )),
+        ("security.memory_store.get_backend", get_backend),
+        ("services.xui_client.get_xui_session", get_xui_session),
+    ]
+    results = []
+    for name, step in steps:
+        started = time.perf_counter()
+        step()
+        results.append((name, time.perf_counter() - started))
+    return results
+
+
+def startup_profile(limit: int = 15) -> None:
+    """
+    Время импорта по модулям и пакетам (через -X importtime)
+    и время инициализации компонентов без сети и БД.
+    """
+    rows = _import_profile()
+    total = next((cum for name, _, cum in rows if name == "app"), 0)
+
+    by_package: dict[str, int] = {}
+    for name, self_us, _ in rows:
+        package = name.split(".", 1)[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+
+    own = ("app", "config", "bot", "db", "security", "services")
+    project = [r for r in rows if r[0].split(".", 1)[0] in own]
+
+    print(f"import app: {total / 1000:.1f} ms\n")
+    print("По пакетам (self):")
+    for package, us in sorted(by_package.items(), key=lambda x: -x[1])[:limit]:
+        print(f"  {us / 1000:8.1f} ms  {package}")
+
+    print("\nМодули проекта (cumulative):")
+    for name, _, cum in sorted(project, key=lambda r: -r[2])[:limit]:
+        print(f"  {cum / 1000:8.1f} ms  {name}")
+
+    print("\nИнициализация:")
+    for name, seconds in _init_profile():
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if "--startup-profile" in sys.argv[1:]:
+        startup_profile()
+    else:
+        asyncio.run(main())
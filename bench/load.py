@@ -0,0 +1,364 @@
+"""
+Нагрузочный прогон всего пайплайна: реальный Dispatcher из app.py,
+синтетические апдейты через feed_update, замоканная сессия Bot API,
+локальный фейковый 3x-ui и SQLite в памяти (нужен aiosqlite).
+
+    python -m bench.load --users 200 --updates 5000 --concurrency 50
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Any
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendPhoto
+from aiogram.methods.base import TelegramMethod
+from aiogram.types import Update
+from aiohttp import web
+
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ============================
+# Mocked Bot API
+# ============================
+
+class FakeSession(BaseSession):
+    """Отвечает на любые методы Bot API без сети, с опциональной задержкой."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: dict[str, int] = {}
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: int | None = None) -> Any:
+        name = type(method).__name__
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        returning = method.__returning__
+        if returning is bool or not hasattr(returning, "model_validate"):
+            return True
+
+        chat_id = getattr(method, "chat_id", None) or 1
+        data = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if isinstance(method, SendPhoto):
+            data["photo"] = [{
+                "file_id": f"fake-{uuid.uuid4().hex}",
+                "file_unique_id": uuid.uuid4().hex[:16],
+                "width": 800,
+                "height": 600,
+            }]
+        return returning.model_validate(data, context={"bot": bot})
+
+    async def stream_content(self, *args, **kwargs):
+        if False:
+            yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+# ============================
+# Fake 3x-ui
+# ============================
+
+def build_fake_xui(inbound_ids: list[int]) -> web.Application:
+    reality = json.dumps({
+        "realitySettings": {
+            "settings": {"publicKey": "x" * 43},
+            "shortIds": ["0123456789abcdef"],
+        }
+    })
+    clients: dict[int, dict[str, dict]] = {i: {} for i in inbound_ids}
+
+    def inbound(i: int) -> dict:
+        return {
+            "id": i,
+            "port": 443,
+            "listen": "vpn.example.com",
+            "streamSettings": reality,
+            "settings": json.dumps({"clients": list(clients[i].values())}),
+        }
+
+    async def login(_):
+        resp = web.json_response({"success": True})
+        resp.set_cookie("3x-ui", "session")
+        return resp
+
+    async def get_one(request):
+        return web.json_response({"success": True, "obj": inbound(int(request.match_info["id"]))})
+
+    async def get_list(_):
+        return web.json_response({"success": True, "obj": [inbound(i) for i in inbound_ids]})
+
+    async def add_client(request):
+        body = await request.json()
+        for c in json.loads(body["settings"])["clients"]:
+            clients[int(body["id"])][c["id"]] = c
+        return web.json_response({"success": True})
+
+    async def update_client(request):
+        body = await request.json()
+        for c in json.loads(body["settings"])["clients"]:
+            clients[int(body["id"])][request.match_info["uuid"]] = c
+        return web.json_response({"success": True})
+
+    async def del_client(request):
+        clients[int(request.match_info["id"])].pop(request.match_info["uuid"], None)
+        return web.json_response({"success": True})
+
+    app = web.Application()
+    app.router.add_post("/login", login)
+    app.router.add_get("/panel/api/inbounds/get/{id}", get_one)
+    app.router.add_get("/panel/api/inbounds/list", get_list)
+    app.router.add_post("/panel/api/inbounds/addClient", add_client)
+    app.router.add_post("/panel/api/inbounds/updateClient/{uuid}", update_client)
+    app.router.add_post("/panel/api/inbounds/{id}/delClient/{uuid}", del_client)
+    return app
+
+
+# ============================
+# Synthetic updates
+# ============================
+
+class UpdateFactory:
+    def __init__(self, users: int):
+        self.user_ids = [700_000_000 + i for i in range(users)]
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1_000_000)
+
+    def _user(self, uid: int) -> dict:
+        return {"id": uid, "is_bot": False, "first_name": "Load"}
+
+    def _message(self, uid: int, **extra) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": uid, "type": "private"},
+            "from": self._user(uid),
+            **extra,
+        }
+
+    def message(self, uid: int, text: str) -> dict:
+        return {"update_id": next(self._update_ids), "message": self._message(uid, text=text)}
+
+    def callback(self, uid: int, data: str) -> dict:
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": uuid.uuid4().hex,
+                "from": self._user(uid),
+                "chat_instance": str(uid),
+                "data": data,
+                "message": self._message(uid, caption="menu"),
+            },
+        }
+
+    def payment(self, uid: int) -> dict:
+        return {
+            "update_id": next(self._update_ids),
+            "message": self._message(uid, successful_payment={
+                "currency": "XTR",
+                "total_amount": 100,
+                "invoice_payload": "vpn_plus",
+                "telegram_payment_charge_id": uuid.uuid4().hex,
+                "provider_payment_charge_id": uuid.uuid4().hex,
+            }),
+        }
+
+    def session(self, uid: int) -> list[dict]:
+        """Типичная последовательность одного пользователя."""
+        return [
+            self.message(uid, "/start"),
+            self.callback(uid, "menu_profile"),
+            self.callback(uid, "menu_home"),
+            self.callback(uid, "menu_plus"),
+            self.callback(uid, "menu_support"),
+            self.message(uid, "Не работает VPN"),
+            self.callback(uid, "support_close_user"),
+        ]
+
+    def stream(self, total: int, payment_ratio: float) -> list[dict]:
+        updates = []
+        while len(updates) < total:
+            uid = random.choice(self.user_ids)
+            if random.random() < payment_ratio:
+                updates.append(self.payment(uid))
+            else:
+                updates.extend(self.session(uid))
+        return updates[:total]
+
+
+# ============================
+# Harness
+# ============================
+
+def _patch_sessions(session_factory) -> None:
+    """Подменяет async_session во всех модулях, которые импортировали его из db.base."""
+    import db.base
+
+    original = db.base.async_session
+    for module in list(sys.modules.values()):
+        if getattr(module, "async_session", None) is original:
+            module.async_session = session_factory
+
+
+def _percentiles(samples: list[float]) -> dict[str, float]:
+    if not samples:
+        return {}
+    s = sorted(x * 1000 for x in samples)
+
+    def pct(p: float) -> float:
+        return round(s[min(len(s) - 1, int(len(s) * p))], 3)
+
+    return {
+        "mean_ms": round(statistics.fmean(s), 3),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": round(s[-1], 3),
+    }
+
+
+async def _measure_loop_lag(samples: list[float], stop: asyncio.Event, interval: float = 0.01):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - started - interval))
+
+
+async def run(args) -> dict:
+    os.chdir(BASE_PATH)
+
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+    from config import settings
+    from db.base import Base
+
+    xui_app = build_fake_xui([int(settings.XUI_INBOUND_ID), int(settings.XUI_INBOUND_ID_INF)])
+    xui_runner = web.AppRunner(xui_app)
+    await xui_runner.setup()
+    site = web.TCPSite(xui_runner, "127.0.0.1", 0)
+    await site.start()
+    port = xui_runner.addresses[0][1]
+    settings.XUI_BASE_URL = f"http://127.0.0.1:{port}"
+    settings.IMAGE_FILE_IDS_PATH = os.path.join(
+        tempfile.gettempdir(), f"kynix-load-file-ids-{os.getpid()}.json"
+    )
+
+    from app import build_dispatcher
+    from security.hash_utils import shutdown_hash_executor
+    from services.sender import start_sender, stop_sender
+    from services.xui_client import close_xui_session
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    _patch_sessions(async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession))
+
+    session = FakeSession(latency=args.api_latency_ms / 1000)
+    bot = Bot(token="123456:LOADTEST", session=session)
+    dp = build_dispatcher()
+    start_sender(bot)
+
+    factory = UpdateFactory(args.users)
+    raw_updates = factory.stream(args.updates, args.payment_ratio)
+    updates = [Update.model_validate(u, context={"bot": bot}) for u in raw_updates]
+
+    # апдейты одного пользователя идут по порядку, разные пользователи — параллельно
+    per_user: dict[int, list[Update]] = {}
+    for u in updates:
+        per_user.setdefault(u.event.from_user.id, []).append(u)
+
+    latencies: list[float] = []
+    errors = 0
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def feed_user(user_updates: list[Update]):
+        nonlocal errors
+        for u in user_updates:
+            async with slots:
+                started = time.perf_counter()
+                try:
+                    await dp.feed_update(bot, u)
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+    lag: list[float] = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(_measure_loop_lag(lag, stop))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(feed_user(v) for v in per_user.values()))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await lag_task
+    await stop_sender()
+    await close_xui_session()
+    await xui_runner.cleanup()
+    await engine.dispose()
+    shutdown_hash_executor()
+
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+            "users": args.users,
+            "updates": len(updates),
+            "concurrency": args.concurrency,
+            "api_latency_ms": args.api_latency_ms,
+        },
+        "updates_per_sec": round(len(updates) / elapsed, 1),
+        "elapsed_seconds": round(elapsed, 3),
+        "errors": errors,
+        "latency": _percentiles(latencies),
+        "event_loop_lag": _percentiles(lag),
+        "bot_api_calls": session.calls,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--payment-ratio", type=float, default=0.02)
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="задержка фейкового Bot API")
+    parser.add_argument("-o", "--output", help="сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    try:
+        import aiosqlite  # noqa: F401
+    except ImportError:
+        print("Нужен aiosqlite: pip install aiosqlite", file=sys.stderr)
+        return 2
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""
+Микробенчмарки горячих функций бота.
+
+    python -m bench.run                          # вывести результаты
+    python -m bench.run -o bench/baseline.json   # сохранить как baseline
+    python -m bench.run -b bench/baseline.json   # сравнить с baseline
+
+get_or_create_user / get_user_last_subscription гоняются на SQLite в памяти
+(нужен aiosqlite), остальное не трогает сеть и БД.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _summary(samples: list[float]) -> dict[str, float]:
+    samples = sorted(samples)
+    ms = [s * 1000 for s in samples]
+    return {
+        "n": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 4),
+        "p50_ms": round(ms[len(ms) // 2], 4),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 4),
+        "min_ms": round(ms[0], 4),
+    }
+
+
+def bench_sync(fn, repeat: int) -> dict[str, float]:
+    fn()  # прогрев
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return _summary(samples)
+
+
+async def bench_async(fn, repeat: int) -> dict[str, float]:
+    await fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - started)
+    return _summary(samples)
+
+
+def _inbound_list_payload(clients: int, inbounds: int = 3) -> bytes:
+    reality = {
+        "realitySettings": {
+            "settings": {"publicKey": "x" * 43},
+            "shortIds": ["0123456789abcdef"],
+        }
+    }
+    objs = []
+    for i in range(1, inbounds + 1):
+        objs.append({
+            "id": i,
+            "port": 443 + i,
+            "listen": "",
+            "streamSettings": json.dumps(reality),
+            "settings": json.dumps({
+                "clients": [
+                    {
+                        "id": str(uuid.uuid4()),
+                        "email": str(10_000_000 + n),
+                        "enable": True,
+                        "expiryTime": 0,
+                        "flow": "xtls-rprx-vision",
+                    }
+                    for n in range(clients)
+                ]
+            }),
+        })
+    return json.dumps({"success": True, "obj": objs}).encode()
+
+
+def run_sync_benches(repeat: int) -> dict[str, dict]:
+    from security.hash_utils import hash_tg_id
+    from security.integrity import verify_project_integrity
+    from services.xui_client import build_vless, parse_inbound_meta
+
+    results = {
+        "hash_tg_id": bench_sync(lambda: hash_tg_id(123456789), max(5, repeat // 20)),
+        "build_vless": bench_sync(
+            lambda: build_vless(
+                str(uuid.uuid4()), "example.com", 443, "Plus", 12345678, "x" * 43, "0123456789abcdef"
+            ),
+            repeat * 10,
+        ),
+        "verify_project_integrity": bench_sync(
+            lambda: verify_project_integrity(BASE_PATH), max(5, repeat // 10)
+        ),
+    }
+
+    for clients in (1_000, 10_000):
+        payload = _inbound_list_payload(clients)
+
+        def parse_list():
+            inbound = next(i for i in json.loads(payload)["obj"] if i["id"] == 2)
+            parse_inbound_meta(inbound)
+
+        def parse_clients():
+            inbound = json.loads(payload)["obj"][1]
+            {c["email"]: c["id"] for c in json.loads(inbound["settings"])["clients"]}
+
+        results[f"get_inbound_parse[{clients}]"] = bench_sync(parse_list, max(5, repeat // 10))
+        results[f"email_index_build[{clients}]"] = bench_sync(parse_clients, max(5, repeat // 10))
+
+    return results
+
+
+async def run_db_benches(repeat: int) -> dict[str, dict]:
+    try:
+        import aiosqlite  # noqa: F401
+    except ImportError:
+        print("aiosqlite не установлен — DB-бенчмарки пропущены", file=sys.stderr)
+        return {}
+
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+    import db.base
+    import db.repo_subs as repo_subs
+    import db.repo_users as repo_users
+    from db.base import Base
+    from db.models import Subscription
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    session_factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    # session_scope берёт db.base.async_session, поэтому подменяем и его
+    db.base.async_session = session_factory
+    repo_users.async_session = session_factory
+    repo_subs.async_session = session_factory
+
+    results = {}
+    next_id = iter(range(500_000_000, 600_000_000))
+
+    async def create_new():
+        await repo_users.get_or_create_user(next(next_id))
+
+    async def cold_existing():
+        repo_users.user_cache.clear()
+        await repo_users.get_or_create_user(500_000_000)
+
+    async def cached():
+        await repo_users.get_or_create_user(500_000_000)
+
+    hash_repeat = max(5, repeat // 20)
+    results["get_or_create_user[new]"] = await bench_async(create_new, hash_repeat)
+    results["get_or_create_user[existing,uncached]"] = await bench_async(cold_existing, hash_repeat)
+    results["get_or_create_user[cached]"] = await bench_async(cached, repeat * 10)
+
+    user = await repo_users.get_or_create_user(500_000_000)
+    async with session_factory() as session:
+        session.add_all(
+            Subscription(user_id=user.id, active=True, created_at=datetime.utcnow())
+            for _ in range(50)
+        )
+        await session.commit()
+
+    results["get_user_last_subscription"] = await bench_async(
+        lambda: repo_subs.get_user_last_subscription(user.id), repeat
+    )
+
+    await engine.dispose()
+    return results
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> bool:
+    ok = True
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"  {name}: нет в baseline")
+            continue
+        delta = (res["p50_ms"] - base["p50_ms"]) / base["p50_ms"] * 100 if base["p50_ms"] else 0.0
+        mark = "REGRESSION" if delta > max_regression else "ok"
+        ok = ok and delta <= max_regression
+        print(f"  {name}: {base['p50_ms']}ms -> {res['p50_ms']}ms ({delta:+.1f}%) {mark}")
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--repeat", type=int, default=200)
+    parser.add_argument("-o", "--output", help="сохранить результаты в JSON")
+    parser.add_argument("-b", "--baseline", help="сравнить с сохранённым JSON")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="допустимый рост p50, %%")
+    args = parser.parse_args()
+
+    results = run_sync_benches(args.repeat)
+    results.update(asyncio.run(run_db_benches(args.repeat)))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        print("\nСравнение с baseline:")
+        if not compare(results, baseline, args.max_regression):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
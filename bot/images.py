@@ -0,0 +1,79 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message
+
+from config import settings
+
+logger = logging.getLogger("images")
+
+IMAGES_DIR = Path("images")
+
+# name -> (mtime_ns, size, sha256), чтобы не перечитывать файл на каждый клик
+_stat_hashes: dict[str, tuple[int, int, str]] = {}
+# sha256 содержимого -> file_id, сохраняется в IMAGE_FILE_IDS_PATH
+_file_ids: dict[str, str] | None = None
+
+
+def _load_file_ids() -> dict[str, str]:
+    global _file_ids
+    if _file_ids is None:
+        try:
+            with open(settings.IMAGE_FILE_IDS_PATH, "r", encoding="utf-8") as f:
+                _file_ids = json.load(f)
+        except (OSError, ValueError):
+            _file_ids = {}
+    return _file_ids
+
+
+def _save_file_ids() -> None:
+    path = settings.IMAGE_FILE_IDS_PATH
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(_load_file_ids(), f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("Failed to persist image file_ids: %s", e)
+
+
+def _content_hash(name: str) -> str:
+    path = IMAGES_DIR / name
+    st = path.stat()
+
+    cached = _stat_hashes.get(name)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()
+    _stat_hashes[name] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+async def answer_menu_photo(message: Message, name: str, **kwargs) -> Message:
+    """
+    Отправляет картинку из images/ через сохранённый file_id.
+    Файл загружается в Telegram только при первой отправке или если он изменился.
+    """
+    digest = _content_hash(name)
+    file_ids = _load_file_ids()
+
+    file_id = file_ids.get(digest)
+    if file_id:
+        try:
+            return await message.answer_photo(file_id, **kwargs)
+        except TelegramBadRequest as e:
+            logger.info("Cached file_id for %s rejected, re-uploading: %s", name, e)
+            file_ids.pop(digest, None)
+
+    sent = await message.answer_photo(FSInputFile(IMAGES_DIR / name), **kwargs)
+
+    if sent.photo:
+        file_ids[digest] = sent.photo[-1].file_id
+        _save_file_ids()
+
+    return sent
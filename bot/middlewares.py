@@ -0,0 +1,113 @@
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Router
+from aiogram.types import TelegramObject, Update
+
+import db.base
+from security.hash_utils import HashQueueFull
+from services.metrics import handler_errors, handler_latency, update_latency
+
+BUSY_TEXT = "⏳ Сейчас большая нагрузка, попробуйте ещё раз через пару секунд."
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer-middleware на dp.update: полное время апдейта по его типу."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            update_latency.observe(time.perf_counter() - started, event.event_type)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner-middleware: время конкретного хэндлера (router, имя функции)."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        handler_obj = data.get("handler")
+        router = data.get("event_router")
+        labels = (
+            getattr(router, "name", "unknown"),
+            getattr(getattr(handler_obj, "callback", None), "__name__", "unknown"),
+        )
+
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except HashQueueFull:
+            # сброс нагрузки, а не ошибка хэндлера — отвечает OverloadMiddleware
+            raise
+        except Exception:
+            handler_errors.inc(*labels)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - started, *labels)
+
+
+class OverloadMiddleware(BaseMiddleware):
+    """
+    Outer-middleware на dp.update: переполненная очередь argon2 (HashQueueFull)
+    превращается в короткий ответ «попробуйте позже» без трейсбека.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        except HashQueueFull:
+            try:
+                if event.message is not None:
+                    await event.message.answer(BUSY_TEXT)
+                elif event.callback_query is not None:
+                    await event.callback_query.answer(BUSY_TEXT)
+            except Exception:
+                pass
+            return None
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Одна AsyncSession на апдейт: передаётся в хэндлеры как `session`,
+    коммитится один раз в конце (или откатывается при исключении).
+    Соединение из пула берётся только при первом запросе.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        async with db.base.async_session() as session:
+            data["session"] = session
+            try:
+                result = await handler(event, data)
+            except BaseException:
+                await session.rollback()
+                raise
+            await session.commit()
+            return result
+
+
+def setup_handler_metrics(router: Router) -> None:
+    middleware = HandlerMetricsMiddleware()
+    for name, observer in router.observers.items():
+        if name in ("update", "error"):
+            continue
+        observer.middleware(middleware)
@@ -4,25 +4,28 @@ from aiogram.types import (
     CallbackQuery,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
-    FSInputFile,
     PreCheckoutQuery,
 )
 
+from sqlalchemy.ext.asyncio import AsyncSession
+
 from db.repo_users import get_or_create_user, get_user_by_fakeid
 from db.repo_subs import (
     get_user_last_subscription,
+    get_user_profile,
     create_subscription_inf,
     create_subscription,
     deactivate_user_subscriptions,
 )
 
+from bot.images import answer_menu_photo
 from services.payments import TARIFFS, build_prices, handle_successful_payment
 from services.payments_refund import refund_stars
-from services.xui_client import delete_xui_client
+from services.sender import notify_admins
+from services.xui_client import delete_xui_client, invalidate_inbound_cache
 
 from config import ADMINS, settings
 
-from db.base import async_session
 from db.models import SupportTicket
 from security.memory_store import remember_support_user
 
@@ -73,31 +76,30 @@ def support_menu_kb():
 
 
 @router.callback_query(F.data == "menu_support")
-async def menu_support(call: CallbackQuery):
+async def menu_support(call: CallbackQuery, session: AsyncSession):
     await call.answer()
 
     real_id = call.from_user.id
     user = await get_or_create_user(real_id)
 
-    remember_support_user(user.fake_id, real_id)
+    await remember_support_user(user.fake_id, real_id)
 
-    async with async_session() as session:
-        from sqlalchemy import select
+    from sqlalchemy import select
 
-        q = select(SupportTicket).where(
-            SupportTicket.user_id == user.id,
-            SupportTicket.is_open.is_(True),
-        )
-        res = await session.execute(q)
-        ticket = res.scalars().first()
+    q = select(SupportTicket).where(
+        SupportTicket.user_id == user.id,
+        SupportTicket.is_open.is_(True),
+    )
+    res = await session.execute(q)
+    ticket = res.scalars().first()
 
-        new_ticket_created = False
-        if not ticket:
-            ticket = SupportTicket(user_id=user.id, is_open=True)
-            session.add(ticket)
-            await session.commit()
-            await session.refresh(ticket)
-            new_ticket_created = True
+    new_ticket_created = False
+    if not ticket:
+        ticket = SupportTicket(user_id=user.id, is_open=True)
+        session.add(ticket)
+        # фиксируем до запросов к Telegram и уведомления админов
+        await session.commit()
+        new_ticket_created = True
 
     text = (
         "🛠 <b>Поддержка</b>\n\n"
@@ -124,18 +126,14 @@ async def menu_support(call: CallbackQuery):
 FAKE ID: {user.fake_id}
 Ticket ID: {ticket.id}
 """
-        for admin_id in settings.ADMINS:
-            try:
-                await call.message.bot.send_message(admin_id, text_admin)
-            except Exception:
-                pass
+        notify_admins(text_admin)
 
 
 @router.message(F.text == "/start")
 async def cmd_start(message: Message):
     user = await get_or_create_user(message.from_user.id)
 
-    photo = FSInputFile("images/start.jpg")
+    photo = "start.jpg"
 
     text = (
         "<b>Добро пожаловать в Kynix VPN 💜</b>\n\n"
@@ -147,14 +145,14 @@ async def cmd_start(message: Message):
         f"Ваш Fake ID: <code>{user.fake_id}</code>"
     )
 
-    await message.answer_photo(photo, caption=text, reply_markup=main_menu_kb())
+    await answer_menu_photo(message, photo, caption=text, reply_markup=main_menu_kb())
 
 
 @router.callback_query(F.data == "menu_plus")
 async def menu_plus(call: CallbackQuery):
     await call.answer()
 
-    photo = FSInputFile("images/plus.jpg")
+    photo = "plus.jpg"
     text = (
         "<b>Тариф Plus</b>\n\n"
         "- Безлимитный трафик\n"
@@ -163,7 +161,7 @@ async def menu_plus(call: CallbackQuery):
         "- Цена: 100⭐ / месяц"
     )
 
-    await call.message.answer_photo(photo, caption=text, reply_markup=plus_menu_kb())
+    await answer_menu_photo(call.message, photo, caption=text, reply_markup=plus_menu_kb())
     await call.message.delete()
 
 
@@ -171,7 +169,7 @@ async def menu_plus(call: CallbackQuery):
 async def menu_proxy(call: CallbackQuery):
     await call.answer()
 
-    photo = FSInputFile("images/proxy.jpg")
+    photo = "proxy.jpg"
 
     text = (
         "<b>Бесплатный Telegram прокси от Kynix VPN</b>\n\n"
@@ -180,7 +178,7 @@ async def menu_proxy(call: CallbackQuery):
         "Нажмите кнопку ниже 👇"
     )
 
-    await call.message.answer_photo(photo, caption=text, reply_markup=proxy_menu_kb())
+    await answer_menu_photo(call.message, photo, caption=text, reply_markup=proxy_menu_kb())
     await call.message.delete()
 
 
@@ -220,7 +218,7 @@ async def process_pre_checkout_query(pre_checkout_q: PreCheckoutQuery):
 
 
 @router.message(F.successful_payment)
-async def process_successful_payment(message: Message):
+async def process_successful_payment(message: Message, session: AsyncSession):
     user = await get_or_create_user(message.from_user.id)
     tariff = TARIFFS[0]
 
@@ -228,26 +226,27 @@ async def process_successful_payment(message: Message):
         bot=message.bot,
         message=message,
         user=user,
-        tariff=tariff
+        tariff=tariff,
+        session=session,
     )
 
 
 @router.callback_query(F.data == "menu_profile")
-async def menu_profile(call: CallbackQuery):
+async def menu_profile(call: CallbackQuery, session: AsyncSession):
     await call.answer()
 
     user = await get_or_create_user(call.from_user.id)
-    sub = await get_user_last_subscription(user.id)
+    profile = await get_user_profile(user.id, session=session)
 
     sub_type = "Нет"
     expires = "Нет"
 
-    if sub and sub.active:
-        sub_type = "Infinite ♾️" if sub.expires_at is None else "Plus"
-        if sub.expires_at:
-            expires = sub.expires_at.strftime("%Y-%m-%d %H:%M")
+    if profile and profile.active:
+        sub_type = "Infinite ♾️" if profile.sub_type == "infinite" else "Plus"
+        if profile.expires_at:
+            expires = profile.expires_at.strftime("%Y-%m-%d %H:%M")
 
-    photo = FSInputFile("images/start.jpg")
+    photo = "start.jpg"
 
     text = (
         "<b>Ваш профиль</b>\n\n"
@@ -256,12 +255,12 @@ async def menu_profile(call: CallbackQuery):
         f"- Срок окончания: {expires}"
     )
 
-    await call.message.answer_photo(photo, caption=text, reply_markup=profile_menu_kb())
+    await answer_menu_photo(call.message, photo, caption=text, reply_markup=profile_menu_kb())
     await call.message.delete()
 
 
 @router.message(F.text.startswith("/inf"))
-async def cmd_inf(message: Message):
+async def cmd_inf(message: Message, session: AsyncSession):
     if message.from_user.id not in ADMINS:
         return await message.answer("❌ У вас нет прав.")
 
@@ -270,12 +269,13 @@ async def cmd_inf(message: Message):
         return await message.answer("Использование: /inf FAKE_ID")
 
     fake_id = int(parts[1])
-    user = await get_user_by_fakeid(fake_id)
+    user = await get_user_by_fakeid(fake_id, session=session)
 
     if not user:
         return await message.answer("❌ Пользователь не найден.")
 
-    sub = await create_subscription_inf(user.id, fake_id)
+    sub = await create_subscription_inf(user.id, fake_id, session=session)
+    await session.commit()
 
     return await message.answer(
         "🎁 Выдана <b>бессрочная подписка</b>!\n\n"
@@ -284,7 +284,7 @@ async def cmd_inf(message: Message):
 
 
 @router.message(F.text.startswith("/refund"))
-async def cmd_refund(message: Message):
+async def cmd_refund(message: Message, session: AsyncSession):
     if message.from_user.id not in ADMINS:
         return await message.answer("❌ У вас нет прав.")
 
@@ -303,11 +303,11 @@ async def cmd_refund(message: Message):
 
     charge_id = parts[3]
 
-    user = await get_user_by_fakeid(fake_id)
+    user = await get_user_by_fakeid(fake_id, session=session)
     if not user:
         return await message.answer("❌ Пользователь с таким FAKE_ID не найден.")
 
-    sub = await get_user_last_subscription(user.id)
+    sub = await get_user_last_subscription(user.id, session=session)
     if not sub or not sub.active:
         return await message.answer("❌ У пользователя нет активной подписки.")
 
@@ -317,14 +317,19 @@ async def cmd_refund(message: Message):
         inbound_id = int(settings.XUI_INBOUND_ID)
 
     try:
-        await delete_xui_client(email=str(fake_id), inbound_id=inbound_id)
+        await delete_xui_client(
+            email=sub.xui_email or str(fake_id),
+            inbound_id=inbound_id,
+            client_uuid=sub.xui_client_id,
+        )
     except Exception as e:
         return await message.answer(
             "❌ Ошибка при удалении конфига в X-UI:\n"
             f"<code>{e}</code>"
         )
 
-    await deactivate_user_subscriptions(user.id)
+    await deactivate_user_subscriptions(user.id, session=session)
+    await session.commit()
 
     result = await refund_stars(
         user_id=real_id,
@@ -346,12 +351,21 @@ async def cmd_refund(message: Message):
         )
 
 
+@router.message(F.text.startswith("/xui_reload"))
+async def cmd_xui_reload(message: Message):
+    if message.from_user.id not in ADMINS:
+        return await message.answer("❌ У вас нет прав.")
+
+    invalidate_inbound_cache()
+    return await message.answer("🔄 Кэш inbound'ов 3x-ui сброшен.")
+
+
 @router.callback_query(F.data == "menu_home")
 async def menu_home(call: CallbackQuery):
     await call.answer()
 
     user = await get_or_create_user(call.from_user.id)
-    photo = FSInputFile("images/start.jpg")
+    photo = "start.jpg"
 
     text = (
         "<b>Добро пожаловать в Kynix VPN 💜</b>\n\n"
@@ -362,5 +376,5 @@ async def menu_home(call: CallbackQuery):
         f"Ваш FakeID: <code>{user.fake_id}</code>"
     )
 
-    await call.message.answer_photo(photo, caption=text, reply_markup=main_menu_kb())
+    await answer_menu_photo(call.message, photo, caption=text, reply_markup=main_menu_kb())
     await call.message.delete()
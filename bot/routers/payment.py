@@ -2,6 +2,7 @@
 from aiogram import Router, F
 from aiogram.types import Message, PreCheckoutQuery
 from aiogram.filters import Command
+from sqlalchemy.ext.asyncio import AsyncSession
 from db.repo_users import get_or_create_user
 from services.payments import TARIFFS, build_prices, handle_successful_payment
 from config import ADMINS
@@ -9,7 +10,7 @@ from config import ADMINS
 router = Router(name="payments")
 
 @router.message(Command("testbuy"))
-async def test_buy(message: Message):
+async def test_buy(message: Message, session: AsyncSession):
     """
     Имитирует успешную оплату без Telegram Stars.
     Полезно для тестирования 3x-ui и всей логики выдачи ключей.
@@ -32,7 +33,8 @@ async def test_buy(message: Message):
         bot=message.bot,
         message=message,
         user=user,
-        tariff=tariff
+        tariff=tariff,
+        session=session,
     )
 
 @router.message(Command("buy"))
@@ -59,7 +61,7 @@ async def process_pre_checkout_query(pre_checkout_query: PreCheckoutQuery):
 
 
 @router.message(F.successful_payment)
-async def successful_payment_handler(message: Message):
+async def successful_payment_handler(message: Message, session: AsyncSession):
     payload = message.successful_payment.invoice_payload
     if not payload.startswith("tariff:"):
         return
@@ -70,4 +72,4 @@ async def successful_payment_handler(message: Message):
     real_id = message.from_user.id
     user = await get_or_create_user(real_id)
 
-    await handle_successful_payment(message.bot, message, user, tariff)
+    await handle_successful_payment(message.bot, message, user, tariff, session=session)
@@ -3,28 +3,29 @@ from datetime import datetime
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import settings
-from db.base import async_session
 from db.models import SupportTicket, User
 from db.repo_users import get_or_create_user
+from services.sender import notify_admins
 from security.memory_store import remember_support_user, forget_support_user, get_real_id
 
 router = Router(name="support")
 
 
 @router.message(Command("support"))
-async def cmd_support(message: Message):
+async def cmd_support(message: Message, session: AsyncSession):
     real_id = message.from_user.id
     user = await get_or_create_user(real_id)
 
-    remember_support_user(user.fake_id, real_id)
+    await remember_support_user(user.fake_id, real_id)
 
-    async with async_session() as session:
-        ticket = SupportTicket(user_id=user.id, is_open=True)
-        session.add(ticket)
-        await session.commit()
-        await session.refresh(ticket)
+    ticket = SupportTicket(user_id=user.id, is_open=True)
+    session.add(ticket)
+    # фиксируем до ответа и уведомления админов — иначе они могут узнать
+    # о тикете, который откатится
+    await session.commit()
 
     await message.answer("Опишите вашу проблему. Наши администраторы скоро ответят вам.")
 
@@ -33,44 +34,40 @@ FAKE ID: {user.fake_id}
 Ticket ID: {ticket.id}
 """
 
-    for admin_id in settings.ADMINS:
-        try:
-            await message.bot.send_message(admin_id, text_admin)
-        except Exception:
-            pass
+    notify_admins(text_admin)
 
 
 @router.callback_query(F.data == "support_close_user")
-async def support_close_user(call: CallbackQuery):
+async def support_close_user(call: CallbackQuery, session: AsyncSession):
     await call.answer("Обращение закрыто")
 
     real_id = call.from_user.id
     user = await get_or_create_user(real_id)
 
-    async with async_session() as session:
-        from sqlalchemy import select
+    from sqlalchemy import select
 
-        q = select(SupportTicket).where(
-            SupportTicket.user_id == user.id,
-            SupportTicket.is_open.is_(True)
-        )
-        res = await session.execute(q)
-        tickets = res.scalars().all()
+    q = select(SupportTicket).where(
+        SupportTicket.user_id == user.id,
+        SupportTicket.is_open.is_(True)
+    )
+    res = await session.execute(q)
+    tickets = res.scalars().all()
 
-        if not tickets:
-            await call.message.edit_text(
-                "У вас нет активных обращений.",
-                reply_markup=None
-            )
-            return
+    if not tickets:
+        await call.message.edit_text(
+            "У вас нет активных обращений.",
+            reply_markup=None
+        )
+        return
 
-        for t in tickets:
-            t.is_open = False
-            t.closed_at = datetime.utcnow()
+    for t in tickets:
+        t.is_open = False
+        t.closed_at = datetime.utcnow()
 
-        await session.commit()
+    # не держим блокировки строк support_tickets на время запросов к Telegram
+    await session.commit()
 
-    forget_support_user(user.fake_id)
+    await forget_support_user(user.fake_id)
 
     try:
         await call.message.edit_text(
@@ -86,7 +83,7 @@ async def support_close_user(call: CallbackQuery):
 
 
 @router.message(Command("close"), F.reply_to_message)
-async def cmd_close_ticket(message: Message):
+async def cmd_close_ticket(message: Message, session: AsyncSession):
     if message.from_user.id not in settings.ADMINS:
         return
 
@@ -105,37 +102,37 @@ async def cmd_close_ticket(message: Message):
         await message.answer("Не удалось определить FAKE ID.")
         return
 
-    async with async_session() as session:
-        from sqlalchemy import select
+    from sqlalchemy import select
 
-        q = select(User).where(User.fake_id == fake_id)
-        res = await session.execute(q)
-        user = res.scalars().first()
+    q = select(User).where(User.fake_id == fake_id)
+    res = await session.execute(q)
+    user = res.scalars().first()
 
-        if not user:
-            await message.answer("Пользователь не найден.")
-            return
+    if not user:
+        await message.answer("Пользователь не найден.")
+        return
 
-        q2 = select(SupportTicket).where(
-            SupportTicket.user_id == user.id,
-            SupportTicket.is_open.is_(True),
-        )
-        res2 = await session.execute(q2)
-        tickets = res2.scalars().all()
+    q2 = select(SupportTicket).where(
+        SupportTicket.user_id == user.id,
+        SupportTicket.is_open.is_(True),
+    )
+    res2 = await session.execute(q2)
+    tickets = res2.scalars().all()
 
-        for t in tickets:
-            t.is_open = False
-            t.closed_at = datetime.utcnow()
+    for t in tickets:
+        t.is_open = False
+        t.closed_at = datetime.utcnow()
 
-        await session.commit()
+    # не держим блокировки строк support_tickets на время запросов к Telegram
+    await session.commit()
 
-    forget_support_user(fake_id)
+    await forget_support_user(fake_id)
 
     await message.answer(f"Тикет пользователя {fake_id} закрыт.")
 
 
 @router.message()
-async def support_messages(message: Message):
+async def support_messages(message: Message, session: AsyncSession):
     if message.from_user.id in settings.ADMINS and message.reply_to_message:
         replied = message.reply_to_message
 
@@ -149,7 +146,7 @@ async def support_messages(message: Message):
         if not fake_id:
             return
 
-        real_id = get_real_id(fake_id)
+        real_id = await get_real_id(fake_id)
         if not real_id:
             await message.answer("Не удалось доставить сообщение: real ID очищен.")
             return
@@ -165,26 +162,31 @@ async def support_messages(message: Message):
         real_id = message.from_user.id
         user = await get_or_create_user(real_id)
 
-        if get_real_id(user.fake_id) is None:
-            return
+        has_mapping = await get_real_id(user.fake_id) is not None
 
-        async with async_session() as session:
-            from sqlalchemy import select
+        from sqlalchemy import select
 
-            q = select(SupportTicket).where(
-                SupportTicket.user_id == user.id,
-                SupportTicket.is_open.is_(True),
-            )
-            res = await session.execute(q)
-            ticket = res.scalars().first()
+        q = select(SupportTicket).where(
+            SupportTicket.user_id == user.id,
+            SupportTicket.is_open.is_(True),
+        )
+        res = await session.execute(q)
+        ticket = res.scalars().first()
 
-            if not ticket:
-                ticket = SupportTicket(user.id, is_open=True)
-                session.add(ticket)
+        # маппинг мог истечь по SUPPORT_MEMORY_TTL_HOURS, а обращение всё ещё открыто
+        if not has_mapping and not ticket:
+            return
+
+        # каждое сообщение продлевает маппинг, чтобы ответ админа дошёл
+        await remember_support_user(user.fake_id, real_id)
 
-            ticket.last_message = message.text
-            await session.commit()
-            await session.refresh(ticket)
+        if not ticket:
+            ticket = SupportTicket(user_id=user.id, is_open=True)
+            session.add(ticket)
+
+        ticket.last_message = message.text
+        # фиксируем до уведомления админов (см. cmd_support)
+        await session.commit()
 
         text_admin = f"""🆘 Сообщение в поддержку
 FAKE ID: {user.fake_id}
@@ -193,10 +195,6 @@ Ticket ID: {ticket.id}
 {message.text}
 """
 
-        for admin_id in settings.ADMINS:
-            try:
-                await message.bot.send_message(admin_id, text_admin)
-            except Exception:
-                pass
+        notify_admins(text_admin)
 
         await message.answer("Ваше сообщение отправлено в поддержку ✅")
@@ -0,0 +1,188 @@
+import asyncio
+import hmac
+import logging
+import secrets
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from config import settings
+
+logger = logging.getLogger("webhook")
+
+_generated_secret: str | None = None
+
+
+def get_webhook_secret() -> str:
+    """
+    WEBHOOK_SECRET, а если он не задан — случайный секрет процесса,
+    который уходит в set_webhook. Без секрета любой, кто достучится до порта,
+    мог бы подделать апдейт (оплату, админскую команду).
+    """
+    global _generated_secret
+    if settings.WEBHOOK_SECRET:
+        return settings.WEBHOOK_SECRET
+
+    if _generated_secret is None:
+        _generated_secret = secrets.token_urlsafe(32)
+        logger.warning(
+            "WEBHOOK_SECRET is not set, using a random per-process secret; "
+            "set it explicitly to post updates to the webhook yourself"
+        )
+    return _generated_secret
+
+
+def update_shard_key(update: Update) -> int:
+    """ID чата (или пользователя), к которому относится апдейт."""
+    try:
+        event = update.event
+    except Exception:
+        return update.update_id
+
+    chat = getattr(event, "chat", None)
+    if chat is not None:
+        return chat.id
+
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+
+    return update.update_id
+
+
+class WebhookHandler:
+    """
+    Принимает апдейты от Telegram и обрабатывает их в фоне,
+    не больше WEBHOOK_MAX_IN_FLIGHT одновременно.
+    """
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        secret_token: str,
+        max_in_flight: int,
+        ordered: bool = False,
+    ):
+        if not secret_token:
+            raise ValueError("Webhook secret token is required")
+
+        self.dp = dp
+        self.bot = bot
+        self.secret_token = secret_token
+        self.ordered = ordered
+        self._slots = asyncio.Semaphore(max(1, max_in_flight))
+        self._tasks: set[asyncio.Task] = set()
+        # ordered=True: апдейты одного чата обрабатываются строго по очереди
+        self._chains: dict[int, asyncio.Task] = {}
+
+    def _check_secret(self, request: web.Request) -> bool:
+        got = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        return hmac.compare_digest(got, self.secret_token)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not self._check_secret(request):
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except ValueError:
+            return web.Response(status=400)
+
+        # ждём свободный слот до ответа — Telegram сам придержит следующие апдейты
+        await self._slots.acquire()
+        self._spawn(update)
+
+        return web.Response()
+
+    def _spawn(self, update: Update) -> None:
+        if not self.ordered:
+            task = asyncio.create_task(self._process(update))
+        else:
+            key = update_shard_key(update)
+            task = asyncio.create_task(self._process(update, self._chains.get(key)))
+            self._chains[key] = task
+            task.add_done_callback(
+                lambda t, k=key: self._chains.pop(k, None) if self._chains.get(k) is t else None
+            )
+
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, update: Update, previous: asyncio.Task | None = None) -> None:
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            await self.dp.feed_update(self.bot, update)
+        except Exception:
+            logger.exception("Failed to process update %s", update.update_id)
+        finally:
+            self._slots.release()
+
+    async def drain(self) -> None:
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def health(_: web.Request) -> web.Response:
+    return web.Response(text="ok")
+
+
+def build_webhook_app(
+    dp: Dispatcher,
+    bot: Bot,
+    *,
+    secret_token: str | None = None,
+    ordered: bool = False,
+) -> web.Application:
+    handler = WebhookHandler(
+        dp,
+        bot,
+        secret_token=secret_token or get_webhook_secret(),
+        max_in_flight=settings.WEBHOOK_MAX_IN_FLIGHT,
+        ordered=ordered,
+    )
+
+    app = web.Application()
+    app["webhook_handler"] = handler
+    app.router.add_post(settings.WEBHOOK_PATH, handler.handle)
+    app.router.add_get("/health", health)
+
+    async def on_cleanup(_: web.Application) -> None:
+        await handler.drain()
+
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    secret_token = get_webhook_secret()
+    app = build_webhook_app(dp, bot, secret_token=secret_token)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT)
+    await site.start()
+
+    # без WEBHOOK_URL сервер поднимается только локально (для тестов синтетическими апдейтами)
+    if settings.WEBHOOK_URL:
+        await bot.set_webhook(
+            url=settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH,
+            secret_token=secret_token,
+            max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=False,
+        )
+
+    logger.info(
+        "Webhook server listening on %s:%s%s",
+        settings.WEBHOOK_HOST,
+        settings.WEBHOOK_PORT,
+        settings.WEBHOOK_PATH,
+    )
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import multiprocessing
+import secrets
+import zlib
+
+import aiohttp
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from config import settings
+from bot.webhook import build_webhook_app, get_webhook_secret, update_shard_key
+
+logger = logging.getLogger("workers")
+
+WORKER_HOST = "127.0.0.1"
+
+
+def shard_for(update: Update, workers: int) -> int:
+    key = update_shard_key(update)
+    return zlib.crc32(str(key).encode()) % workers
+
+
+# ============================
+# WORKER
+# ============================
+
+async def run_worker(index: int, port: int, secret_token: str) -> None:
+    from app import build_dispatcher, create_bot, shutdown_services, start_services
+
+    bot = create_bot()
+    dp = build_dispatcher()
+
+    # фоновые задачи крутит только воркер 0, лимит отправки делится между всеми
+    await start_services(
+        bot,
+        primary=index == 0,
+        send_rate=settings.SEND_RATE_PER_SECOND / settings.WORKERS,
+        metrics_port=settings.METRICS_PORT + index if settings.METRICS_PORT else 0,
+    )
+
+    app = build_webhook_app(dp, bot, secret_token=secret_token, ordered=True)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WORKER_HOST, port).start()
+    logger.info("Worker %s listening on %s:%s", index, WORKER_HOST, port)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await shutdown_services()
+        await bot.session.close()
+
+
+def worker_main(index: int, port: int, secret_token: str) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s [%(levelname)s] %(name)s[w{index}] - %(message)s",
+    )
+    try:
+        asyncio.run(run_worker(index, port, secret_token))
+    except KeyboardInterrupt:
+        pass
+
+
+# ============================
+# SUPERVISOR
+# ============================
+
+class WorkerHandle:
+    def __init__(self, index: int, secret_token: str):
+        self.index = index
+        self.port = settings.WORKER_BASE_PORT + index
+        self.secret_token = secret_token
+        self.process: multiprocessing.Process | None = None
+        self.queue: asyncio.Queue[Update] = asyncio.Queue(maxsize=settings.WORKER_QUEUE_SIZE)
+        self.failed_checks = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://{WORKER_HOST}:{self.port}"
+
+    def start(self) -> None:
+        ctx = multiprocessing.get_context("spawn")
+        self.process = ctx.Process(
+            target=worker_main,
+            args=(self.index, self.port, self.secret_token),
+            name=f"kynix-worker-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        self.failed_checks = 0
+        logger.info("Started worker %s (pid %s)", self.index, self.process.pid)
+
+    def stop(self) -> None:
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=10)
+            if self.process.is_alive():
+                self.process.kill()
+
+    async def restart(self) -> None:
+        logger.warning("Restarting worker %s", self.index)
+        # join() блокирующий — в отдельном потоке, чтобы не стоял приём апдейтов
+        await asyncio.to_thread(self.stop)
+        self.start()
+
+
+class Supervisor:
+    """
+    Получает апдейты и раскладывает их по WORKERS процессам по хэшу ID чата,
+    так что апдейты одного пользователя всегда попадают в один воркер по порядку.
+    """
+
+    def __init__(self, bot: Bot, dp: Dispatcher):
+        self.bot = bot
+        self.dp = dp
+        token = secrets.token_urlsafe(32)
+        self.workers = [WorkerHandle(i, token) for i in range(settings.WORKERS)]
+        self._http: aiohttp.ClientSession | None = None
+
+    async def dispatch(self, update: Update) -> None:
+        worker = self.workers[shard_for(update, len(self.workers))]
+        await worker.queue.put(update)
+
+    async def _forward_loop(self, worker: WorkerHandle) -> None:
+        while True:
+            update = await worker.queue.get()
+            payload = update.model_dump(mode="json", exclude_none=True, by_alias=True)
+
+            for attempt in range(1, settings.WORKER_FORWARD_RETRIES + 1):
+                try:
+                    async with self._http.post(
+                        worker.url + settings.WEBHOOK_PATH,
+                        json=payload,
+                        headers={"X-Telegram-Bot-Api-Secret-Token": worker.secret_token},
+                    ) as resp:
+                        if resp.status == 200:
+                            break
+                        logger.warning("Worker %s answered %s", worker.index, resp.status)
+                except aiohttp.ClientError as e:
+                    logger.warning("Worker %s unreachable: %s", worker.index, e)
+                await asyncio.sleep(min(2 ** attempt * 0.1, 5))
+            else:
+                logger.error(
+                    "Dropping update %s after %s attempts to worker %s",
+                    update.update_id,
+                    settings.WORKER_FORWARD_RETRIES,
+                    worker.index,
+                )
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.WORKER_HEALTH_INTERVAL_SECONDS)
+            for worker in self.workers:
+                if worker.process is None or not worker.process.is_alive():
+                    await worker.restart()
+                    continue
+
+                try:
+                    async with self._http.get(
+                        worker.url + "/health",
+                        timeout=aiohttp.ClientTimeout(total=5),
+                    ) as resp:
+                        healthy = resp.status == 200
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    healthy = False
+
+                worker.failed_checks = 0 if healthy else worker.failed_checks + 1
+                if worker.failed_checks >= 3:
+                    await worker.restart()
+
+    async def _poll_updates(self) -> None:
+        offset = None
+        allowed = self.dp.resolve_used_update_types()
+        while True:
+            try:
+                updates = await self.bot.get_updates(
+                    offset=offset, timeout=30, allowed_updates=allowed
+                )
+            except Exception as e:
+                logger.warning("getUpdates failed: %s", e)
+                await asyncio.sleep(1)
+                continue
+
+            for update in updates:
+                offset = update.update_id + 1
+                await self.dispatch(update)
+
+    async def _serve_webhook(self) -> None:
+        secret_token = get_webhook_secret()
+
+        async def handle(request: web.Request) -> web.Response:
+            got = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            if not secrets.compare_digest(got, secret_token):
+                return web.Response(status=401)
+            try:
+                update = Update.model_validate(await request.json(), context={"bot": self.bot})
+            except ValueError:
+                return web.Response(status=400)
+            await self.dispatch(update)
+            return web.Response()
+
+        app = web.Application()
+        app.router.add_post(settings.WEBHOOK_PATH, handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT).start()
+
+        if settings.WEBHOOK_URL:
+            await self.bot.set_webhook(
+                url=settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH,
+                secret_token=secret_token,
+                max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=self.dp.resolve_used_update_types(),
+            )
+
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    async def run(self) -> None:
+        # апдейты шардируются по чату: ответ админа попадает в воркер админа,
+        # а маппинг fake_id -> real ID лежит в воркере пользователя
+        if settings.MEMORY_BACKEND != "redis":
+            raise RuntimeError(
+                f"WORKERS={settings.WORKERS} requires MEMORY_BACKEND=redis, "
+                f"got {settings.MEMORY_BACKEND!r}"
+            )
+
+        for worker in self.workers:
+            worker.start()
+
+        self._http = aiohttp.ClientSession()
+        tasks = [asyncio.create_task(self._forward_loop(w)) for w in self.workers]
+        tasks.append(asyncio.create_task(self._health_loop()))
+
+        try:
+            if settings.BOT_MODE == "webhook":
+                await self._serve_webhook()
+            else:
+                await self.bot.delete_webhook(drop_pending_updates=False)
+                await self._poll_updates()
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._http.close()
+            await asyncio.gather(*(asyncio.to_thread(w.stop) for w in self.workers))
+
+
+async def run_supervisor(bot: Bot, dp: Dispatcher) -> None:
+    await Supervisor(bot, dp).run()
@@ -18,19 +18,77 @@ class Settings(BaseSettings):
     DB_USER: str = "root"
     DB_PASSWORD: str = ""
     DB_NAME: str = "kynix"
+    DB_MIGRATE_ON_STARTUP: bool = True
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
 
     XUI_BASE_URL: str
     XUI_USERNAME: str
     XUI_PASSWORD: str
     XUI_INBOUND_ID: int
     XUI_INBOUND_ID_INF: int  
+    XUI_POOL_MAX_CONNECTIONS: int = 10
+    XUI_POOL_MAX_KEEPALIVE: int = 5
+    XUI_TIMEOUT_SECONDS: float = 15.0
+    XUI_INBOUND_CACHE_TTL_SECONDS: int = 300
+    XUI_BATCH_MAX_SIZE: int = 20
+    XUI_BATCH_LINGER_MS: int = 20
+    CLIENT_POOL_SIZE: int = 20
+    CLIENT_POOL_LOW_WATER: int = 5
+    CLIENT_POOL_REFILL_INTERVAL_SECONDS: int = 60
+
+    EXPIRY_SWEEP_INTERVAL_SECONDS: int = 600
+    EXPIRY_SWEEP_BATCH_SIZE: int = 200
+    EXPIRY_SWEEP_CONCURRENCY: int = 5
 
 
     CODE_HASH: str | None = None
+    INTEGRITY_MANIFEST_PATH: str = ".integrity_manifest.json"
+    INTEGRITY_HASH_WORKERS: int = 4
+    INTEGRITY_RECHECK_INTERVAL_SECONDS: int = 600
     HASH_SALT: str  
+    HASH_WORKERS: int = 2
+    HASH_QUEUE_LIMIT: int = 64
+    FAKE_ID_BLOCK_SIZE: int = 20
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL_SECONDS: int = 600
+    PROFILE_CACHE_TTL_SECONDS: int = 30
     MEMORY_CLEAN_INTERVAL_HOURS: int = 6
+    SUPPORT_MEMORY_TTL_HOURS: int = 72
+    MEMORY_STORE_MAX_SIZE: int = 100000
+    MEMORY_SWEEP_INTERVAL_SECONDS: int = 60
+    MEMORY_BACKEND: str = "memory"  # memory | redis
+    MEMORY_REDIS_URL: str = "redis://localhost:6379/0"
+    MEMORY_REDIS_PREFIX: str = "kynix:"
+    IMAGE_FILE_IDS_PATH: str = "images/file_ids.json"
     PROVIDER_TOKEN: str | None = None
 
+    SEND_WORKERS: int = 8
+    SEND_RATE_PER_SECOND: float = 30.0
+    SEND_PER_CHAT_INTERVAL_SECONDS: float = 1.0
+    SEND_MAX_RETRIES: int = 3
+
+    BOT_MODE: str = "polling"  # polling | webhook
+    WEBHOOK_URL: str | None = None
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    WEBHOOK_SECRET: str | None = None
+    WEBHOOK_MAX_CONNECTIONS: int = 40
+    WEBHOOK_MAX_IN_FLIGHT: int = 100
+
+    WORKERS: int = 1
+    WORKER_BASE_PORT: int = 8100
+    WORKER_QUEUE_SIZE: int = 1000
+    WORKER_FORWARD_RETRIES: int = 5
+    WORKER_HEALTH_INTERVAL_SECONDS: int = 10
+
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9108  # 0 — выключено; воркеры слушают METRICS_PORT + номер
+
     @field_validator("ADMINS", mode="before")
     @classmethod
     def parse_admins(cls, v):
@@ -1,11 +1,19 @@
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from config import settings
+from services.metrics import db_query_latency, register_gauges
 
 DATABASE_URL = (
     f"mysql+aiomysql://{settings.DB_USER}:{settings.DB_PASSWORD}"
@@ -18,5 +26,138 @@ class Base(DeclarativeBase):
     pass
 
 
-engine = create_async_engine(DATABASE_URL, echo=False, future=True)
-async_session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+pool_stats = {
+    "checkouts": 0,
+    "checkout_timeouts": 0,
+    "checkout_wait_seconds_total": 0.0,
+    "checkout_wait_seconds_max": 0.0,
+    "connects": 0,
+    "invalidated": 0,
+}
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Пул, который считает время ожидания свободного соединения."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            pool_stats["checkout_timeouts"] += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            pool_stats["checkouts"] += 1
+            pool_stats["checkout_wait_seconds_total"] += waited
+            if waited > pool_stats["checkout_wait_seconds_max"]:
+                pool_stats["checkout_wait_seconds_max"] = waited
+
+
+_engine: AsyncEngine | None = None
+
+
+def get_engine() -> AsyncEngine:
+    """
+    Движок создаётся при первом обращении, а не при импорте:
+    вместе с ним грузится драйвер aiomysql.
+    """
+    global _engine
+    if _engine is None:
+        _engine = create_async_engine(
+            DATABASE_URL,
+            echo=False,
+            future=True,
+            poolclass=InstrumentedPool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+        _install_listeners(_engine)
+        async_session.configure(bind=_engine)
+    return _engine
+
+
+def __getattr__(name: str):
+    # совместимость с `from db.base import engine`
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class _LazySessionMaker(async_sessionmaker):
+    def __call__(self, **local_kw) -> AsyncSession:
+        get_engine()
+        return super().__call__(**local_kw)
+
+
+async_session = _LazySessionMaker(expire_on_commit=False, class_=AsyncSession)
+
+
+@asynccontextmanager
+async def session_scope(session: AsyncSession | None = None) -> AsyncIterator[AsyncSession]:
+    """
+    Сессия запроса, если она передана (коммитит её DbSessionMiddleware),
+    иначе — своя короткая сессия с commit/rollback на выходе.
+    """
+    if session is not None:
+        yield session
+        return
+
+    async with async_session() as own:
+        try:
+            yield own
+            await own.commit()
+        except BaseException:
+            await own.rollback()
+            raise
+
+
+def _on_connect(dbapi_connection, connection_record):
+    pool_stats["connects"] += 1
+
+
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    pool_stats["invalidated"] += 1
+
+
+# время старта хранится на контексте выполнения, а не в conn.info:
+# при ошибке after_cursor_execute не вызывается, и запись в conn.info
+# осталась бы на соединении из пула навсегда
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._kynix_query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_kynix_query_started", None)
+    if started is None:
+        return
+    kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    db_query_latency.observe(time.perf_counter() - started, kind)
+
+
+def _install_listeners(engine: AsyncEngine) -> None:
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine, "connect", _on_connect)
+    event.listen(sync_engine, "invalidate", _on_invalidate)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def get_pool_metrics() -> dict[str, float]:
+    if _engine is None:
+        return dict(pool_stats)
+    pool = _engine.sync_engine.pool
+    return {
+        **pool_stats,
+        "pool_size": pool.size(),
+        "in_use": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+    }
+
+
+register_gauges("kynix_db_pool", "Состояние пула соединений MySQL", get_pool_metrics)
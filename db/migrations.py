@@ -0,0 +1,277 @@
+"""
+Версионированные миграции схемы.
+
+    python -m db.migrations upgrade   # применить недостающие
+    python -m db.migrations status    # текущая версия
+    python -m db.migrations explain   # проверить, что горячие запросы идут по индексам
+"""
+import asyncio
+import logging
+import sys
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    Connection,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    inspect,
+    select,
+    text,
+)
+
+from .base import get_engine
+from .models import Subscription, SupportTicket
+
+logger = logging.getLogger("migrations")
+
+
+# Снимки таблиц на момент своей миграции. Модели из db.models меняются,
+# а каждая миграция должна создавать ровно то, что было в её версии схемы.
+_schema = MetaData()
+
+_users_v1 = Table(
+    "users",
+    _schema,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("tg_hash", String(255), nullable=False, unique=True, index=True),
+    Column("fake_id", Integer, nullable=False, unique=True, index=True),
+    Column("created_at", DateTime, nullable=False),
+)
+
+_subscriptions_v1 = Table(
+    "subscriptions",
+    _schema,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("active", Boolean, nullable=False),
+    # NULL — бессрочная подписка (Infinite)
+    Column("expires_at", DateTime, nullable=True),
+    Column("xui_client_id", String(255), nullable=True),
+    Column("xui_email", String(255), nullable=True),
+    Column("xui_config", Text, nullable=True),
+    Column("created_at", DateTime, nullable=False),
+)
+
+_support_tickets_v1 = Table(
+    "support_tickets",
+    _schema,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("is_open", Boolean, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("closed_at", DateTime, nullable=True),
+    Column("last_message", Text, nullable=True),
+)
+
+_id_counters_v3 = Table(
+    "id_counters",
+    _schema,
+    Column("name", String(64), primary_key=True),
+    Column("value", BigInteger, nullable=False),
+)
+
+_pooled_clients_v4 = Table(
+    "pooled_clients",
+    _schema,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("inbound_id", Integer, nullable=False, index=True),
+    Column("xui_client_id", String(255), nullable=False, unique=True),
+    Column("xui_email", String(255), nullable=False),
+    Column("claimed", Boolean, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("claimed_at", DateTime, nullable=True),
+)
+
+
+def _create_baseline_tables(conn: Connection) -> None:
+    _schema.create_all(
+        conn,
+        tables=[_users_v1, _subscriptions_v1, _support_tickets_v1],
+        checkfirst=True,
+    )
+
+
+def _add_hot_query_indexes(conn: Connection) -> None:
+    existing = {
+        table: {ix["name"] for ix in inspect(conn).get_indexes(table)}
+        for table in ("subscriptions", "support_tickets")
+    }
+    for index in (
+        Index("ix_subscriptions_user_id_id", _subscriptions_v1.c.user_id, _subscriptions_v1.c.id),
+        Index(
+            "ix_subscriptions_active_expires_at",
+            _subscriptions_v1.c.active,
+            _subscriptions_v1.c.expires_at,
+        ),
+        Index(
+            "ix_support_tickets_user_id_is_open",
+            _support_tickets_v1.c.user_id,
+            _support_tickets_v1.c.is_open,
+        ),
+    ):
+        if index.name not in existing[index.table.name]:
+            index.create(conn)
+
+
+def _create_id_counters(conn: Connection) -> None:
+    _id_counters_v3.create(conn, checkfirst=True)
+
+
+def _create_pooled_clients(conn: Connection) -> None:
+    _pooled_clients_v4.create(conn, checkfirst=True)
+
+
+def _make_expires_at_nullable(conn: Connection) -> None:
+    # базы, созданные старым create_all, получили NOT NULL, и /inf на них падал
+    if conn.dialect.name == "mysql":
+        conn.exec_driver_sql("ALTER TABLE subscriptions MODIFY expires_at DATETIME NULL")
+
+
+MIGRATIONS: list[tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "baseline tables: users, subscriptions, support_tickets", _create_baseline_tables),
+    (2, "composite indexes for hot queries", _add_hot_query_indexes),
+    (3, "id_counters table for fake_id allocation", _create_id_counters),
+    (4, "pooled_clients table for the warm client pool", _create_pooled_clients),
+    (5, "subscriptions.expires_at nullable for infinite subscriptions", _make_expires_at_nullable),
+]
+
+
+def _ensure_version_table(conn: Connection) -> None:
+    conn.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        " version INTEGER NOT NULL PRIMARY KEY,"
+        " description VARCHAR(255) NOT NULL,"
+        " applied_at DATETIME NOT NULL"
+        ")"
+    )
+
+
+def _current_version(conn: Connection) -> int:
+    _ensure_version_table(conn)
+    res = conn.execute(text("SELECT MAX(version) FROM schema_version"))
+    return res.scalar() or 0
+
+
+def _upgrade(conn: Connection) -> list[int]:
+    current = _current_version(conn)
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info("Applying migration %s: %s", version, description)
+        migrate(conn)
+        conn.execute(
+            text(
+                "INSERT INTO schema_version (version, description, applied_at) "
+                "VALUES (:v, :d, :t)"
+            ),
+            {"v": version, "d": description, "t": datetime.utcnow()},
+        )
+        applied.append(version)
+    return applied
+
+
+async def run_migrations() -> list[int]:
+    async with get_engine().begin() as conn:
+        return await conn.run_sync(_upgrade)
+
+
+async def get_schema_version() -> int:
+    async with get_engine().begin() as conn:
+        return await conn.run_sync(_current_version)
+
+
+# ============================
+# EXPLAIN-проверка горячих запросов
+# ============================
+
+def _hot_queries():
+    now = datetime.utcnow()
+    return [
+        (
+            "get_user_last_subscription",
+            select(Subscription)
+            .where(Subscription.user_id == 1)
+            .order_by(Subscription.id.desc())
+            .limit(1),
+            {"ix_subscriptions_user_id_id"},
+        ),
+        (
+            "open_support_tickets",
+            select(SupportTicket).where(
+                SupportTicket.user_id == 1,
+                SupportTicket.is_open.is_(True),
+            ),
+            {"ix_support_tickets_user_id_is_open"},
+        ),
+        (
+            "expired_subscriptions_page",
+            select(Subscription)
+            .where(Subscription.active.is_(True), Subscription.expires_at < now)
+            .order_by(Subscription.expires_at, Subscription.id)
+            .limit(200),
+            {"ix_subscriptions_active_expires_at"},
+        ),
+    ]
+
+
+def _explain(conn: Connection) -> list[tuple[str, str | None, bool]]:
+    if conn.dialect.name != "mysql":
+        raise RuntimeError(f"EXPLAIN check supports MySQL only, got {conn.dialect.name}")
+
+    results = []
+    for name, stmt, expected in _hot_queries():
+        compiled = stmt.compile(dialect=conn.dialect)
+        # у aiomysql/pymysql paramstyle "format" — параметры нужны кортежем по порядку %s
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+        row = conn.exec_driver_sql("EXPLAIN " + str(compiled), params).mappings().first()
+        key = row.get("key") if row else None
+        results.append((name, key, key in expected))
+    return results
+
+
+async def explain_hot_queries() -> list[tuple[str, str | None, bool]]:
+    """(запрос, индекс из EXPLAIN, используется ли ожидаемый индекс)"""
+    async with get_engine().connect() as conn:
+        return await conn.run_sync(_explain)
+
+
+async def _cli(command: str) -> int:
+    try:
+        return await _run_command(command)
+    finally:
+        await get_engine().dispose()
+
+
+async def _run_command(command: str) -> int:
+    if command == "upgrade":
+        applied = await run_migrations()
+        print(f"Applied: {applied or 'nothing'}")
+    elif command == "status":
+        print(f"Schema version: {await get_schema_version()} (latest {MIGRATIONS[-1][0]})")
+    elif command == "explain":
+        ok = True
+        for name, key, uses_index in await explain_hot_queries():
+            print(f"{'OK  ' if uses_index else 'FAIL'} {name}: key={key}")
+            ok = ok and uses_index
+        return 0 if ok else 1
+    else:
+        print("Использование: python -m db.migrations [upgrade|status|explain]")
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    sys.exit(asyncio.run(_cli(command)))
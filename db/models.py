@@ -1,7 +1,7 @@
 from datetime import datetime, timedelta
 from typing import Optional
 
-from sqlalchemy import BigInteger, String, Integer, DateTime, Boolean, ForeignKey, Text
+from sqlalchemy import BigInteger, String, Integer, DateTime, Boolean, ForeignKey, Text, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import Base
@@ -21,12 +21,18 @@ class User(Base):
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
+    __table_args__ = (
+        Index("ix_subscriptions_user_id_id", "user_id", "id"),
+        Index("ix_subscriptions_active_expires_at", "active", "expires_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     active: Mapped[bool] = mapped_column(Boolean, default=True)
-    expires_at: Mapped[datetime] = mapped_column(
-        default=lambda: datetime.utcnow() + timedelta(days=31)
+    # None — бессрочная подписка (Infinite)
+    expires_at: Mapped[Optional[datetime]] = mapped_column(
+        nullable=True,
+        default=lambda: datetime.utcnow() + timedelta(days=31),
     )
 
     xui_client_id: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
@@ -40,6 +46,9 @@ class Subscription(Base):
 
 class SupportTicket(Base):
     __tablename__ = "support_tickets"
+    __table_args__ = (
+        Index("ix_support_tickets_user_id_is_open", "user_id", "is_open"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
@@ -50,4 +59,28 @@ class SupportTicket(Base):
 
     last_message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
 
-    user: Mapped["User"] = relationship(back_populates="support_tickets")
\ No newline at end of file
+    user: Mapped["User"] = relationship(back_populates="support_tickets")
+
+
+class PooledClient(Base):
+    """
+    Заранее созданный (выключенный) клиент 3x-ui, который выдаётся при оплате.
+    """
+    __tablename__ = "pooled_clients"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    inbound_id: Mapped[int] = mapped_column(Integer, index=True)
+    xui_client_id: Mapped[str] = mapped_column(String(255), unique=True)
+    xui_email: Mapped[str] = mapped_column(String(255))
+
+    claimed: Mapped[bool] = mapped_column(Boolean, default=False)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+    claimed_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+
+
+class IdCounter(Base):
+    """Персистентные счётчики (например, для выдачи fake_id блоками)."""
+    __tablename__ = "id_counters"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    value: Mapped[int] = mapped_column(BigInteger, default=0)
@@ -1,12 +1,128 @@
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 
-from sqlalchemy import select, update
-from db.base import async_session
+from sqlalchemy import and_, event, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from db.base import async_session, session_scope
 from db.models import Subscription, User
-from services.xui_client import create_client_inf, create_client_for_user
+from services.client_pool import provision_client_inf, provision_client_for_user
+from services.metrics import register_gauges
 
-async def get_user_last_subscription(user_id: int):
-    async with async_session() as session:
+
+@dataclass(frozen=True, slots=True)
+class ProfileView:
+    fake_id: int
+    sub_type: str | None  # "plus" / "infinite" / None, если активной подписки нет
+    expires_at: datetime | None
+    active: bool
+
+
+class _ProfileCache:
+    """Короткий TTL-кэш user_id -> ProfileView. TTL <= 0 отключает кэш."""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._data: dict[int, tuple[float, ProfileView]] = {}
+
+    def get(self, user_id: int) -> ProfileView | None:
+        item = self._data.get(user_id)
+        if item is None or item[0] < time.monotonic():
+            self._data.pop(user_id, None)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return item[1]
+
+    def put(self, user_id: int, view: ProfileView) -> None:
+        if self.ttl <= 0:
+            return
+        self._data[user_id] = (time.monotonic() + self.ttl, view)
+
+    def invalidate(self, user_id: int) -> None:
+        self._data.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+profile_cache = _ProfileCache(settings.PROFILE_CACHE_TTL_SECONDS)
+
+register_gauges(
+    "kynix_profile_cache",
+    "Кэш профилей пользователей",
+    lambda: {"size": len(profile_cache), "hits": profile_cache.hits, "misses": profile_cache.misses},
+)
+
+
+def invalidate_profile(user_id: int, session: AsyncSession | None = None) -> None:
+    """
+    Сбрасывает профиль сразу и, если запись идёт в общей сессии запроса,
+    ещё раз после её commit — иначе параллельное чтение до commit
+    успеет положить в кэш старые данные.
+    """
+    profile_cache.invalidate(user_id)
+    if session is not None:
+        event.listen(
+            session.sync_session,
+            "after_commit",
+            lambda _: profile_cache.invalidate(user_id),
+            once=True,
+        )
+
+
+async def get_user_profile(user_id: int, session: AsyncSession | None = None) -> ProfileView | None:
+    """
+    Профиль одним запросом: users LEFT JOIN последняя подписка
+    (max(id) по индексу ix_subscriptions_user_id_id).
+    """
+    view = profile_cache.get(user_id)
+    if view is not None:
+        return view
+
+    last_sub_id = (
+        select(func.max(Subscription.id))
+        .where(Subscription.user_id == User.id)
+        .correlate(User)
+        .scalar_subquery()
+    )
+    q = (
+        select(User.fake_id, Subscription.active, Subscription.expires_at)
+        .outerjoin(Subscription, Subscription.id == last_sub_id)
+        .where(User.id == user_id)
+    )
+
+    async with session_scope(session) as session:
+        row = (await session.execute(q)).one_or_none()
+
+    if row is None:
+        return None
+
+    active = bool(row.active)
+    if active:
+        sub_type = "infinite" if row.expires_at is None else "plus"
+    else:
+        sub_type = None
+
+    view = ProfileView(
+        fake_id=row.fake_id,
+        sub_type=sub_type,
+        expires_at=row.expires_at if active else None,
+        active=active,
+    )
+    profile_cache.put(user_id, view)
+    return view
+
+
+async def get_user_last_subscription(user_id: int, session: AsyncSession | None = None):
+    async with session_scope(session) as session:
         q = (
             select(Subscription)
             .where(Subscription.user_id == user_id)
@@ -16,25 +132,74 @@ async def get_user_last_subscription(user_id: int):
         res = await session.execute(q)
         return res.scalar_one_or_none()
 
-async def deactivate_user_subscriptions(user_id: int):
+async def deactivate_user_subscriptions(user_id: int, session: AsyncSession | None = None):
     """
     Полностью деактивирует все подписки пользователя.
     Используется при возврате средств или выдаче новой INFINITE.
     """
-    async with async_session() as session:
+    async with session_scope(session) as session:
         await session.execute(
             update(Subscription)
             .where(Subscription.user_id == user_id)
             .values(active=False)
         )
-        await session.commit()
+        await session.flush()
+        invalidate_profile(user_id, session)
 
-async def create_subscription(user_id: int, days: int):
+async def get_expired_subscriptions_page(
+    now: datetime,
+    after: tuple[datetime, int] | None,
+    limit: int,
+) -> list[Subscription]:
+    """
+    Страница активных, но истёкших подписок по индексу (active, expires_at).
+    after — (expires_at, id) последней строки предыдущей страницы.
+    """
     async with async_session() as session:
+        q = select(Subscription).where(
+            Subscription.active.is_(True),
+            Subscription.expires_at < now,
+        )
+        if after is not None:
+            last_expires, last_id = after
+            q = q.where(
+                or_(
+                    Subscription.expires_at > last_expires,
+                    and_(
+                        Subscription.expires_at == last_expires,
+                        Subscription.id > last_id,
+                    ),
+                )
+            )
+        q = q.order_by(Subscription.expires_at, Subscription.id).limit(limit)
+        res = await session.execute(q)
+        return list(res.scalars().all())
+
+
+async def deactivate_subscriptions(sub_ids: list[int]) -> int:
+    if not sub_ids:
+        return 0
+
+    async with async_session() as session:
+        res = await session.execute(
+            update(Subscription)
+            .where(Subscription.id.in_(sub_ids))
+            .values(active=False)
+        )
+        await session.commit()
+
+    # user_id страницы не известны — проходы редкие, проще сбросить весь кэш
+    if res.rowcount:
+        profile_cache.clear()
+    return res.rowcount
+
+
+async def create_subscription(user_id: int, days: int, session: AsyncSession | None = None):
+    async with session_scope(session) as session:
         result = await session.execute(select(User).where(User.id == user_id))
         user = result.scalar_one()
 
-        xui = await create_client_for_user(user.fake_id, days=days)
+        xui = await provision_client_for_user(user.fake_id, days=days)
 
         sub = Subscription(
             user_id=user_id,
@@ -47,13 +212,14 @@ async def create_subscription(user_id: int, days: int):
         )
 
         session.add(sub)
-        await session.commit()
+        await session.flush()
         await session.refresh(sub)
+        invalidate_profile(user_id, session)
         return sub
 
 
-async def create_subscription_inf(user_id: int, fake_id: int):
-    async with async_session() as session:
+async def create_subscription_inf(user_id: int, fake_id: int, session: AsyncSession | None = None):
+    async with session_scope(session) as session:
 
         await session.execute(
             update(Subscription)
@@ -61,7 +227,7 @@ async def create_subscription_inf(user_id: int, fake_id: int):
             .values(active=False)
         )
 
-        xui = await create_client_inf(fake_id)
+        xui = await provision_client_inf(fake_id)
 
         new_sub = Subscription(
             user_id=user_id,
@@ -74,6 +240,7 @@ async def create_subscription_inf(user_id: int, fake_id: int):
         )
 
         session.add(new_sub)
-        await session.commit()
+        await session.flush()
         await session.refresh(new_sub)
+        invalidate_profile(user_id, session)
         return new_sub
@@ -1,49 +1,184 @@
+import asyncio
+import hashlib
+import hmac
+import secrets
+import time
+from collections import OrderedDict
 from typing import Optional
 
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .base import async_session
-from .models import User
-from security.hash_utils import hash_tg_id
-from security.id_utils import generate_fake_id
+from config import settings
+from .base import async_session, session_scope
+from .models import IdCounter, User
+from security.hash_utils import hash_tg_id_async
+from security.id_utils import FakeIdAllocator
+from services.metrics import register_gauges
+
+
+class _UserCache:
+    """
+    LRU+TTL кэш real_tg_id -> User.
+    Ключ — HMAC от ID на случайном ключе процесса, сам ID в памяти не хранится.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._key = secrets.token_bytes(32)
+        self._data: OrderedDict[bytes, tuple[float, User]] = OrderedDict()
+
+    def _digest(self, real_tg_id: int) -> bytes:
+        return hmac.new(self._key, str(real_tg_id).encode(), hashlib.sha256).digest()
+
+    def get(self, real_tg_id: int) -> User | None:
+        key = self._digest(real_tg_id)
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def put(self, real_tg_id: int, user: User) -> None:
+        if self.max_size <= 0:
+            return
+        key = self._digest(real_tg_id)
+        self._data[key] = (time.monotonic() + self.ttl, user)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+user_cache = _UserCache(
+    max_size=settings.USER_CACHE_SIZE,
+    ttl_seconds=settings.USER_CACHE_TTL_SECONDS,
+)
+
+register_gauges(
+    "kynix_user_cache",
+    "Кэш Telegram ID -> User",
+    lambda: {"size": len(user_cache), "hits": user_cache.hits, "misses": user_cache.misses},
+)
+
+
+_inflight: dict[bytes, asyncio.Task] = {}
+
+
+def _inflight_done(key: bytes, task: asyncio.Task) -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    # все ожидающие могли уже уйти — забираем исключение, чтобы не было
+    # "Task exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
 
 
 async def get_or_create_user(real_tg_id: int) -> User:
 
-    tg_hash = hash_tg_id(str(real_tg_id))
+    user = user_cache.get(real_tg_id)
+    if user is not None:
+        return user
+
+    # single-flight: параллельные вызовы для одного ID ждут одну задачу.
+    # Задача отдельная и под shield, поэтому отмена одного вызывающего
+    # не отменяет разрешение для остальных
+    key = user_cache._digest(real_tg_id)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_resolve_user(real_tg_id))
+        _inflight[key] = task
+        task.add_done_callback(lambda t, k=key: _inflight_done(k, t))
+
+    return await asyncio.shield(task)
+
+
+async def _resolve_user(real_tg_id: int) -> User:
+    # всегда своя сессия с немедленным commit: результат уходит в кэш и другим
+    # ожидающим запросам, поэтому не должен зависеть от транзакции одного апдейта
+    tg_hash = await hash_tg_id_async(real_tg_id)
+
+    while True:
+        async with async_session() as session:
+            q = select(User).where(User.tg_hash == tg_hash)
+            result = await session.execute(q)
+            user: Optional[User] = result.scalars().first()
+
+            if user:
+                user_cache.put(real_tg_id, user)
+                return user
 
-    async with async_session() as session:
-        q = select(User).where(User.tg_hash == tg_hash)
-        result = await session.execute(q)
-        user: Optional[User] = result.scalars().first()
+            fake_id = await fake_id_allocator.next_id()
 
-        if user:
+            user = User(
+                tg_hash=tg_hash,
+                fake_id=fake_id,
+            )
+            session.add(user)
+            try:
+                await session.commit()
+            except IntegrityError:
+                # другой процесс успел вставить этот tg_hash, либо fake_id совпал
+                # со случайным ID, выданным до счётчика, — перечитываем и берём
+                # следующий fake_id
+                await session.rollback()
+                continue
+
+            await session.refresh(user)
+            user_cache.put(real_tg_id, user)
             return user
 
-        fake_id = await _generate_unique_fake_id(session)
 
-        user = User(
-            tg_hash=tg_hash,
-            fake_id=fake_id,
-        )
-        session.add(user)
-        await session.commit()
-        await session.refresh(user)
-        return user
+FAKE_ID_COUNTER = "fake_id"
 
 
-async def _generate_unique_fake_id(session) -> int:
+async def _reserve_fake_id_block(size: int) -> int:
+    """Сдвигает счётчик fake_id на size под блокировкой строки, возвращает начало блока."""
     while True:
-        fake_id = generate_fake_id()
-        q = select(User).where(User.fake_id == fake_id)
-        res = await session.execute(q)
-        if not res.scalars().first():
-            return fake_id
+        async with async_session() as session:
+            res = await session.execute(
+                select(IdCounter)
+                .where(IdCounter.name == FAKE_ID_COUNTER)
+                .with_for_update()
+            )
+            counter = res.scalar_one_or_none()
+
+            if counter is None:
+                start = 0
+                session.add(IdCounter(name=FAKE_ID_COUNTER, value=size))
+            else:
+                start = counter.value
+                counter.value = start + size
+
+            try:
+                await session.commit()
+            except IntegrityError:
+                # первую строку счётчика одновременно создал другой процесс
+                await session.rollback()
+                continue
+            return start
+
+
+fake_id_allocator = FakeIdAllocator(_reserve_fake_id_block, settings.FAKE_ID_BLOCK_SIZE)
 
 
-async def get_user_by_fakeid(fake_id: int) -> User | None:
-    async with async_session() as session:
+async def get_user_by_fakeid(fake_id: int, session: AsyncSession | None = None) -> User | None:
+    async with session_scope(session) as session:
         result = await session.execute(
             select(User).where(User.fake_id == fake_id)
         )
-        return result.scalar_one_or_none()
\ No newline at end of file
+        return result.scalar_one_or_none()
@@ -1,6 +1,12 @@
+import asyncio
 import hashlib
-from argon2.low_level import hash_secret_raw, Type as Argon2Type
+from concurrent.futures import ThreadPoolExecutor
+
 from config import settings
+from services.metrics import hash_latency, hash_rejected
+
+_executor: ThreadPoolExecutor | None = None
+_in_flight = 0
 
 
 def _get_salt() -> bytes:
@@ -15,6 +21,9 @@ def _get_salt() -> bytes:
 
 
 def hash_tg_id(real_id: int | str) -> str:
+    # argon2 (cffi) грузится при первом хэшировании, а не при импорте роутеров
+    from argon2.low_level import hash_secret_raw, Type as Argon2Type
+
     real_id = str(real_id)
 
     fp = hashlib.sha256(real_id.encode()).hexdigest().encode()
@@ -30,3 +39,58 @@ def hash_tg_id(real_id: int | str) -> str:
     )
 
     return hashed.hex()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.HASH_WORKERS),
+            thread_name_prefix="argon2",
+        )
+    return _executor
+
+
+class HashQueueFull(RuntimeError):
+    """В пуле argon2 уже HASH_WORKERS + HASH_QUEUE_LIMIT вызовов."""
+
+
+async def hash_tg_id_async(real_id: int | str) -> str:
+    """
+    Argon2 считается в отдельном пуле потоков (argon2-cffi отпускает GIL),
+    чтобы не блокировать event loop. Одновременно в пуле не больше
+    HASH_WORKERS + HASH_QUEUE_LIMIT вызовов, сверх этого — сразу HashQueueFull,
+    а не бесконечное ожидание.
+    """
+    global _in_flight
+    if _in_flight >= max(1, settings.HASH_WORKERS) + max(0, settings.HASH_QUEUE_LIMIT):
+        hash_rejected.inc()
+        raise HashQueueFull("argon2 queue is full")
+
+    with hash_latency.time():
+        loop = asyncio.get_running_loop()
+        job = _get_executor().submit(hash_tg_id, real_id)
+        _in_flight += 1
+        # слот освобождается, когда поток закончил, а не когда ушёл вызывающий
+        job.add_done_callback(lambda _: _release_slot_threadsafe(loop))
+        return await asyncio.wrap_future(job)
+
+
+def _release_slot() -> None:
+    global _in_flight
+    _in_flight -= 1
+
+
+def _release_slot_threadsafe(loop: asyncio.AbstractEventLoop) -> None:
+    try:
+        loop.call_soon_threadsafe(_release_slot)
+    except RuntimeError:
+        # цикл уже закрыт (остановка)
+        pass
+
+
+def shutdown_hash_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -1,5 +1,79 @@
-import random
+import asyncio
+import hashlib
+import hmac
+from typing import Awaitable, Callable
 
+from config import settings
 
-def generate_fake_id() -> int:
-    return random.randint(10_000_000, 99_999_999)
+FAKE_ID_MIN = 10_000_000
+FAKE_ID_MAX = 99_999_999
+FAKE_ID_SPACE = FAKE_ID_MAX - FAKE_ID_MIN + 1
+
+# сбалансированная сеть Фейстеля на 28 битах (2^28 > 90M),
+# значения вне диапазона прогоняются повторно (cycle walking)
+_HALF_BITS = 14
+_HALF_MASK = (1 << _HALF_BITS) - 1
+_ROUNDS = 8
+
+
+def _get_key() -> bytes:
+    # ключ перестановки выводится из HASH_SALT: при его смене всё равно
+    # меняются tg_hash всех пользователей
+    return hmac.new(settings.HASH_SALT.encode(), b"fake_id", hashlib.sha256).digest()
+
+
+def _round(key: bytes, i: int, half: int) -> int:
+    digest = hmac.new(key, bytes((i,)) + half.to_bytes(2, "big"), hashlib.sha256).digest()
+    return int.from_bytes(digest[:2], "big") & _HALF_MASK
+
+
+def _feistel(key: bytes, value: int) -> int:
+    left, right = value >> _HALF_BITS, value & _HALF_MASK
+    for i in range(_ROUNDS):
+        left, right = right, left ^ _round(key, i, right)
+    return (left << _HALF_BITS) | right
+
+
+def fake_id_for(counter: int, key: bytes | None = None) -> int:
+    """
+    Биекция [0, FAKE_ID_SPACE) -> [10_000_000, 99_999_999]:
+    разные значения счётчика всегда дают разные fake_id, соседние не похожи.
+    """
+    if not 0 <= counter < FAKE_ID_SPACE:
+        raise ValueError(f"fake_id counter out of range: {counter}")
+
+    key = key or _get_key()
+    value = _feistel(key, counter)
+    while value >= FAKE_ID_SPACE:
+        value = _feistel(key, value)
+    return FAKE_ID_MIN + value
+
+
+class FakeIdAllocator:
+    """
+    Выдаёт fake_id по персистентному счётчику.
+    reserve(n) атомарно сдвигает счётчик в БД на n и возвращает начало блока,
+    поэтому процессы не пересекаются, а в БД ходим раз в block_size пользователей.
+    Неиспользованный хвост блока при рестарте просто пропадает.
+    """
+
+    def __init__(self, reserve: Callable[[int], Awaitable[int]], block_size: int):
+        self._reserve = reserve
+        self._block_size = max(1, block_size)
+        self._next = 0
+        self._end = 0
+        self._key = _get_key()
+        self._lock = asyncio.Lock()
+
+    async def next_id(self) -> int:
+        async with self._lock:
+            if self._next >= self._end:
+                start = await self._reserve(self._block_size)
+                self._next, self._end = start, start + self._block_size
+
+            counter = self._next
+            self._next += 1
+
+        if counter >= FAKE_ID_SPACE:
+            raise RuntimeError("fake_id space exhausted")
+        return fake_id_for(counter, self._key)
@@ -1,8 +1,20 @@
+import asyncio
 import hashlib
+import html
+import json
+import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Iterable
 
+logger = logging.getLogger("integrity")
+
+MANIFEST_VERSION = 2
+CHUNK_SIZE = 8192
+
 
 def iter_project_files(base_path: str) -> Iterable[Path]:
     base = Path(base_path)
@@ -12,17 +24,233 @@ def iter_project_files(base_path: str) -> Iterable[Path]:
         yield path
 
 
-def verify_project_integrity(base_path: str) -> str:
+def _sorted_files(base_path: str) -> list[Path]:
+    return sorted(iter_project_files(base_path), key=lambda p: str(p))
+
+
+def _rel(path: Path, base_path: str) -> str:
+    return str(path.relative_to(base_path))
+
+
+def _hash_file(path: Path) -> str:
     sha = hashlib.sha256()
-    files = sorted(iter_project_files(base_path), key=lambda p: str(p))
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            sha.update(chunk)
+    return sha.hexdigest()
 
-    for path in files:
-        sha.update(str(path.relative_to(base_path)).encode("utf-8"))
+
+def project_hash_from_digests(digests: dict[str, str]) -> str:
+    """
+    Хэш проекта (CODE_HASH) — sha256 по строкам "путь\\0sha256 файла\\n"
+    в порядке путей. Считается из пофайловых хэшей, поэтому
+    перехэшировать нужно только изменившиеся файлы.
+    """
+    sha = hashlib.sha256()
+    for rel in sorted(digests):
+        sha.update(rel.encode("utf-8"))
         sha.update(b"\0")
-        with open(path, "rb") as f:
-            while True:
-                chunk = f.read(8192)
-                if not chunk:
-                    break
-                sha.update(chunk)
+        sha.update(digests[rel].encode("ascii"))
+        sha.update(b"\n")
     return sha.hexdigest()
+
+
+def _scan(base_path: str) -> tuple[str, dict[str, str]]:
+    """Полный проход без манифеста: хэш проекта и sha256 каждого файла."""
+    digests = {
+        _rel(path, base_path): _hash_file(path) for path in _sorted_files(base_path)
+    }
+    return project_hash_from_digests(digests), digests
+
+
+def verify_project_integrity(base_path: str) -> str:
+    return _scan(base_path)[0]
+
+
+# ============================
+# Манифест
+# ============================
+
+@dataclass
+class IntegrityReport:
+    project_hash: str
+    changed: list[str] = field(default_factory=list)
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    rehashed: int = 0
+
+
+def _manifest_path(base_path: str, manifest_path: str) -> Path:
+    path = Path(manifest_path)
+    return path if path.is_absolute() else Path(base_path) / path
+
+
+def load_manifest(base_path: str, manifest_path: str) -> dict:
+    try:
+        with open(_manifest_path(base_path, manifest_path), encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != MANIFEST_VERSION:
+        return {}
+    return data
+
+
+def _save_manifest(base_path: str, manifest_path: str, data: dict) -> None:
+    path = _manifest_path(base_path, manifest_path)
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("Failed to save integrity manifest %s: %s", path, e)
+
+
+def verify_with_manifest(base_path: str, manifest_path: str, workers: int = 4) -> IntegrityReport:
+    """
+    Инкрементальная проверка: файлы с теми же size/mtime берутся из манифеста,
+    остальные хэшируются параллельно, хэш проекта собирается из пофайловых.
+    Каждый изменившийся файл читается ровно один раз.
+    """
+    old = load_manifest(base_path, manifest_path)
+    old_files: dict[str, dict] = old.get("files", {})
+
+    files = _sorted_files(base_path)
+    entries: dict[str, dict] = {}
+    stale: list[tuple[str, Path, os.stat_result]] = []
+
+    for path in files:
+        rel = _rel(path, base_path)
+        st = path.stat()
+        prev = old_files.get(rel)
+        if prev and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+            entries[rel] = prev
+        else:
+            stale.append((rel, path, st))
+
+    if stale:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="integrity") as pool:
+            digests = list(pool.map(lambda item: _hash_file(item[1]), stale))
+        for (rel, _, st), digest in zip(stale, digests):
+            entries[rel] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+
+    report = IntegrityReport(project_hash="", rehashed=len(stale))
+    report.added = sorted(set(entries) - set(old_files))
+    report.removed = sorted(set(old_files) - set(entries))
+    report.changed = sorted(
+        rel for rel, _, _ in stale
+        if rel in old_files and old_files[rel]["sha256"] != entries[rel]["sha256"]
+    )
+
+    report.project_hash = project_hash_from_digests(
+        {rel: entry["sha256"] for rel, entry in entries.items()}
+    )
+
+    if stale or report.removed or report.project_hash != old.get("project_hash"):
+        _save_manifest(base_path, manifest_path, {
+            "version": MANIFEST_VERSION,
+            "project_hash": report.project_hash,
+            "files": entries,
+        })
+
+    return report
+
+
+# ============================
+# Фоновая перепроверка
+# ============================
+
+_recheck_executor: ThreadPoolExecutor | None = None
+
+
+def _lower_priority() -> None:
+    # nice действует на конкретный поток, поэтому перепроверка
+    # не отнимает CPU у основного цикла
+    if hasattr(os, "setpriority"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except OSError:
+            pass
+
+
+def _get_recheck_executor() -> ThreadPoolExecutor:
+    global _recheck_executor
+    if _recheck_executor is None:
+        _recheck_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="integrity-recheck",
+            initializer=_lower_priority,
+        )
+    return _recheck_executor
+
+
+def _describe_changes(baseline: dict[str, str], current: dict[str, str], limit: int = 20) -> list[str]:
+    lines = [f"~ {rel}" for rel in sorted(current) if rel in baseline and baseline[rel] != current[rel]]
+    lines += [f"+ {rel}" for rel in sorted(set(current) - set(baseline))]
+    lines += [f"- {rel}" for rel in sorted(set(baseline) - set(current))]
+    if len(lines) > limit:
+        lines = lines[:limit] + [f"… и ещё {len(lines) - limit}"]
+    return lines
+
+
+async def integrity_recheck_loop(base_path: str, expected_hash: str, manifest_path: str, interval: float):
+    """
+    Периодически полностью перечитывает файлы (без доверия к mtime)
+    в отдельном низкоприоритетном потоке и сообщает админам об изменениях.
+    """
+    from services.sender import notify_admins
+
+    baseline = {
+        rel: entry["sha256"]
+        for rel, entry in load_manifest(base_path, manifest_path).get("files", {}).items()
+    }
+    reported: str | None = None
+    loop = asyncio.get_running_loop()
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            current_hash, digests = await loop.run_in_executor(
+                _get_recheck_executor(), _scan, base_path
+            )
+        except Exception:
+            logger.exception("Integrity re-check failed")
+            continue
+
+        if current_hash == expected_hash or current_hash == reported:
+            continue
+
+        reported = current_hash
+        changes = _describe_changes(baseline, digests)
+        logger.error(
+            "Project files changed at runtime: expected %s, got %s; %s",
+            expected_hash,
+            current_hash,
+            ", ".join(changes) or "no per-file baseline",
+        )
+        text = (
+            "⚠️ Исходный код бота изменился во время работы.\n"
+            f"\nТекущий хэш: <code>{current_hash}</code>"
+        )
+        if changes:
+            text += "\n\n<code>" + html.escape("\n".join(changes)) + "</code>"
+        notify_admins(text)
+
+
+def start_integrity_watch(base_path: str, expected_hash: str, manifest_path: str, interval: float):
+    if interval <= 0:
+        return
+    asyncio.create_task(
+        integrity_recheck_loop(base_path, expected_hash, manifest_path, interval)
+    )
+
+
+def shutdown_integrity_watch() -> None:
+    global _recheck_executor
+    if _recheck_executor is not None:
+        _recheck_executor.shutdown(wait=False, cancel_futures=True)
+        _recheck_executor = None
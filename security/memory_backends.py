@@ -0,0 +1,253 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+
+class TTLStore:
+    """
+    fake_id -> real_tg_id с TTL на каждую запись и жёстким лимитом размера.
+    TTL у всех записей одинаковый, поэтому порядок в OrderedDict совпадает
+    с порядком истечения: и вытеснение, и очистка идут с начала за O(1).
+    """
+
+    def __init__(self, ttl_seconds: float, max_size: int):
+        self.ttl = ttl_seconds
+        self.max_size = max_size
+        self.evicted = 0
+        self.expired = 0
+        self._data: OrderedDict[int, tuple[float, int]] = OrderedDict()
+
+    def set(self, key: int, value: int) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evicted += 1
+
+    def get(self, key: int) -> int | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[0] <= time.monotonic():
+            del self._data[key]
+            self.expired += 1
+            return None
+        return item[1]
+
+    def pop(self, key: int) -> None:
+        self._data.pop(key, None)
+
+    def expire(self, limit: int) -> int:
+        """Удаляет до limit истёкших записей с начала очереди."""
+        now = time.monotonic()
+        removed = 0
+        while self._data and removed < limit:
+            key, (expires_at, _) = next(iter(self._data.items()))
+            if expires_at > now:
+                break
+            del self._data[key]
+            removed += 1
+        self.expired += removed
+        return removed
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class MemoryBackend(ABC):
+    """
+    Хранилище fake_id -> real_tg_id, разбитое на пространства имён
+    ("user", "support"), у каждого свой TTL.
+    """
+
+    @abstractmethod
+    async def set(self, namespace: str, fake_id: int, real_tg_id: int) -> None:
+        ...
+
+    @abstractmethod
+    async def get(self, fake_id: int, *namespaces: str) -> int | None:
+        """Значение из первого пространства имён, где оно есть."""
+
+    @abstractmethod
+    async def delete(self, namespace: str, fake_id: int) -> None:
+        ...
+
+    async def expire(self) -> None:
+        pass
+
+    def sizes(self) -> dict[str, int]:
+        return {}
+
+    async def close(self) -> None:
+        pass
+
+
+class InProcessBackend(MemoryBackend):
+    def __init__(self, ttls: dict[str, float], max_size: int):
+        self.stores = {ns: TTLStore(ttl, max_size) for ns, ttl in ttls.items()}
+
+    async def set(self, namespace: str, fake_id: int, real_tg_id: int) -> None:
+        self.stores[namespace].set(fake_id, real_tg_id)
+
+    async def get(self, fake_id: int, *namespaces: str) -> int | None:
+        for ns in namespaces:
+            value = self.stores[ns].get(fake_id)
+            if value is not None:
+                return value
+        return None
+
+    async def delete(self, namespace: str, fake_id: int) -> None:
+        self.stores[namespace].pop(fake_id)
+
+    async def expire(self) -> None:
+        # небольшими порциями, чтобы не держать event loop
+        for store in self.stores.values():
+            while store.expire(limit=1000) == 1000:
+                await asyncio.sleep(0)
+
+    def sizes(self) -> dict[str, int]:
+        sizes = {ns: len(store) for ns, store in self.stores.items()}
+        sizes["evicted"] = sum(s.evicted for s in self.stores.values())
+        sizes["expired"] = sum(s.expired for s in self.stores.values())
+        return sizes
+
+
+class RespError(Exception):
+    pass
+
+
+class RespClient:
+    """
+    Минимальный клиент протокола Redis (RESP2): одно соединение,
+    команды выполняются по очереди. Подходит для Redis, KeyDB, Valkey
+    и локальных заглушек, говорящих на RESP.
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        try:
+            if self.password:
+                await self._roundtrip("AUTH", self.password)
+            if self.db:
+                await self._roundtrip("SELECT", self.db)
+        except BaseException:
+            # иначе следующие команды пошли бы без авторизации или не в ту БД
+            await self._drop()
+            raise
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        out = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            out.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        return b"".join(out)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("RESP connection closed")
+
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RespError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length == -1:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length == -1:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+
+        raise RespError(f"Unexpected RESP reply: {line!r}")
+
+    async def _roundtrip(self, *args):
+        self._writer.write(self._encode(args))
+        await self._writer.drain()
+        return await asyncio.wait_for(self._read_reply(), self.timeout)
+
+    async def command(self, *args):
+        async with self._lock:
+            for attempt in (1, 2):
+                if self._writer is None:
+                    await self._connect()
+                try:
+                    return await self._roundtrip(*args)
+                except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    await self._drop()
+                    if attempt == 2:
+                        raise
+                except BaseException:
+                    # отмена или ошибка посреди запроса оставляет ответ в потоке,
+                    # и следующая команда прочитала бы чужой ответ
+                    await self._drop()
+                    raise
+
+    async def _drop(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def close(self) -> None:
+        async with self._lock:
+            await self._drop()
+
+
+class RedisBackend(MemoryBackend):
+    """
+    Общее для нескольких процессов хранилище. TTL ставит сам Redis (SET ... EX),
+    так что фоновая очистка не нужна.
+    """
+
+    def __init__(self, url: str, ttls: dict[str, float], prefix: str = "kynix:"):
+        self.client = RespClient(url)
+        self.ttls = ttls
+        self.prefix = prefix
+
+    def _key(self, namespace: str, fake_id: int) -> str:
+        return f"{self.prefix}{namespace}:{fake_id}"
+
+    async def set(self, namespace: str, fake_id: int, real_tg_id: int) -> None:
+        ttl = max(1, int(self.ttls[namespace]))
+        await self.client.command("SET", self._key(namespace, fake_id), real_tg_id, "EX", ttl)
+
+    async def get(self, fake_id: int, *namespaces: str) -> int | None:
+        values = await self.client.command(
+            "MGET", *(self._key(ns, fake_id) for ns in namespaces)
+        )
+        for value in values or []:
+            if value is not None:
+                return int(value)
+        return None
+
+    async def delete(self, namespace: str, fake_id: int) -> None:
+        await self.client.command("DEL", self._key(namespace, fake_id))
+
+    async def close(self) -> None:
+        await self.client.close()
@@ -1,33 +1,70 @@
 import asyncio
-from typing import Dict
 
 from config import settings
+from services.metrics import register_gauges
+from security.memory_backends import InProcessBackend, MemoryBackend, RedisBackend
 
-real_ids: Dict[int, int] = {}
+USER_NS = "user"
+SUPPORT_NS = "support"
 
-support_real_ids: Dict[int, int] = {}
+_backend: MemoryBackend | None = None
 
 
-def remember_user(fake_id: int, real_tg_id: int) -> None:
-    real_ids[fake_id] = real_tg_id
+def get_backend() -> MemoryBackend:
+    global _backend
+    if _backend is None:
+        ttls = {
+            USER_NS: settings.MEMORY_CLEAN_INTERVAL_HOURS * 3600,
+            SUPPORT_NS: settings.SUPPORT_MEMORY_TTL_HOURS * 3600,
+        }
+        if settings.MEMORY_BACKEND == "redis":
+            _backend = RedisBackend(
+                settings.MEMORY_REDIS_URL,
+                ttls,
+                prefix=settings.MEMORY_REDIS_PREFIX,
+            )
+        else:
+            _backend = InProcessBackend(ttls, max_size=settings.MEMORY_STORE_MAX_SIZE)
+    return _backend
 
 
-def remember_support_user(fake_id: int, real_tg_id: int) -> None:
-    support_real_ids[fake_id] = real_tg_id
+def set_backend(backend: MemoryBackend) -> None:
+    global _backend
+    _backend = backend
 
 
-def forget_support_user(fake_id: int) -> None:
-    support_real_ids.pop(fake_id, None)
+async def remember_user(fake_id: int, real_tg_id: int) -> None:
+    await get_backend().set(USER_NS, fake_id, real_tg_id)
 
 
-def get_real_id(fake_id: int) -> int | None:
-    return real_ids.get(fake_id) or support_real_ids.get(fake_id)
+async def remember_support_user(fake_id: int, real_tg_id: int) -> None:
+    await get_backend().set(SUPPORT_NS, fake_id, real_tg_id)
+
+
+async def forget_support_user(fake_id: int) -> None:
+    await get_backend().delete(SUPPORT_NS, fake_id)
+
+
+async def get_real_id(fake_id: int) -> int | None:
+    return await get_backend().get(fake_id, USER_NS, SUPPORT_NS)
+
+
+def memory_store_sizes() -> dict[str, int]:
+    return get_backend().sizes()
+
+
+register_gauges("kynix_memory_store", "Хранилище fake_id -> real ID", memory_store_sizes)
 
 
 async def clean_memory():
     while True:
-        await asyncio.sleep(settings.MEMORY_CLEAN_INTERVAL_HOURS * 3600)
-        real_ids.clear()
+        await asyncio.sleep(settings.MEMORY_SWEEP_INTERVAL_SECONDS)
+        await get_backend().expire()
+
+
+async def close_memory_store() -> None:
+    if _backend is not None:
+        await _backend.close()
 
 
 def start_schedulers():
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import delete, func, select, update
+
+from config import settings
+from db.base import async_session
+from db.models import PooledClient
+from services.xui_client import (
+    XuiClientNotFound,
+    add_clients,
+    build_client_js,
+    build_vless,
+    create_client_for_user,
+    create_client_inf,
+    delete_xui_client,
+    get_inbound_meta,
+    get_xui_session,
+    update_xui_client,
+)
+
+logger = logging.getLogger("client_pool")
+
+_refill_event: asyncio.Event | None = None
+_refill_task: asyncio.Task | None = None
+
+
+def _pool_inbounds() -> list[int]:
+    return [int(settings.XUI_INBOUND_ID), int(settings.XUI_INBOUND_ID_INF)]
+
+
+async def _claim(inbound_id: int) -> PooledClient | None:
+    async with async_session() as session:
+        res = await session.execute(
+            select(PooledClient)
+            .where(
+                PooledClient.inbound_id == inbound_id,
+                PooledClient.claimed.is_(False),
+            )
+            .order_by(PooledClient.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        pooled = res.scalar_one_or_none()
+        if pooled is None:
+            return None
+
+        pooled.claimed = True
+        pooled.claimed_at = datetime.utcnow()
+        await session.commit()
+        return pooled
+
+
+async def _discard(pooled: PooledClient, inbound_id: int) -> None:
+    """
+    Клиент, которого не удалось включить: удаляем его из 3x-ui и из пула,
+    а если удалить не вышло — возвращаем строку в пул, чтобы она не зависла
+    в claimed=True.
+    """
+    try:
+        await delete_xui_client(inbound_id=inbound_id, client_uuid=pooled.xui_client_id)
+        removed = True
+    except XuiClientNotFound:
+        removed = True
+    except Exception as e:
+        logger.warning("Failed to delete pooled client %s: %s", pooled.xui_client_id, e)
+        removed = False
+
+    async with async_session() as session:
+        if removed:
+            await session.execute(delete(PooledClient).where(PooledClient.id == pooled.id))
+        else:
+            await session.execute(
+                update(PooledClient)
+                .where(PooledClient.id == pooled.id)
+                .values(claimed=False, claimed_at=None)
+            )
+        await session.commit()
+
+
+async def _provision_from_pool(fake_id: int, expiry_ts: int, tag: str, inbound_id: int):
+    """
+    Забирает клиента из пула и включает его с нужным сроком.
+    None — если пул пуст или не удалось включить клиента.
+    """
+    try:
+        pooled = await _claim(inbound_id)
+    except Exception as e:
+        logger.warning("Client pool claim failed for inbound %s: %s", inbound_id, e)
+        return None
+    finally:
+        request_refill()
+
+    if pooled is None:
+        return None
+
+    email = f"{fake_id}"
+    try:
+        meta = await get_inbound_meta(get_xui_session(), inbound_id)
+        await update_xui_client(
+            pooled.xui_client_id,
+            inbound_id,
+            build_client_js(pooled.xui_client_id, email, expiry_ts),
+        )
+    except Exception as e:
+        logger.warning(
+            "Failed to enable pooled client %s on inbound %s: %s",
+            pooled.xui_client_id,
+            inbound_id,
+            e,
+        )
+        try:
+            await _discard(pooled, inbound_id)
+        except Exception as e_discard:
+            logger.warning("Failed to release pooled client %s: %s", pooled.xui_client_id, e_discard)
+        return None
+
+    return {
+        "uuid": pooled.xui_client_id,
+        "subId": uuid.uuid4().hex[:16],
+        "email": email,
+        "vless": build_vless(
+            pooled.xui_client_id, meta.host, meta.port, tag, fake_id, meta.pbk, meta.sid
+        ),
+    }
+
+
+async def provision_client_for_user(fake_id: int, days: int):
+    expiry_ts = int(time.time() * 1000 + days * 86400 * 1000)
+    inbound_plus = int(settings.XUI_INBOUND_ID)
+
+    xui = await _provision_from_pool(fake_id, expiry_ts, "Plus", inbound_plus)
+    if xui is not None:
+        return xui
+
+    return await create_client_for_user(fake_id, days=days)
+
+
+async def provision_client_inf(fake_id: int):
+    inbound_inf = int(settings.XUI_INBOUND_ID_INF)
+
+    xui = await _provision_from_pool(fake_id, 0, "Inf", inbound_inf)
+    if xui is not None:
+        return xui
+
+    return await create_client_inf(fake_id)
+
+
+async def _available(inbound_id: int) -> int:
+    async with async_session() as session:
+        res = await session.execute(
+            select(func.count(PooledClient.id)).where(
+                PooledClient.inbound_id == inbound_id,
+                PooledClient.claimed.is_(False),
+            )
+        )
+        return res.scalar_one()
+
+
+async def refill_inbound(inbound_id: int) -> int:
+    available = await _available(inbound_id)
+    if available > settings.CLIENT_POOL_LOW_WATER:
+        return 0
+
+    missing = settings.CLIENT_POOL_SIZE - available
+    if missing <= 0:
+        return 0
+
+    clients = []
+    for _ in range(missing):
+        uid = str(uuid.uuid4())
+        clients.append(build_client_js(uid, f"pool-{uid[:13]}", 0, enable=False))
+
+    await add_clients(get_xui_session(), inbound_id, clients)
+
+    async with async_session() as session:
+        session.add_all(
+            PooledClient(
+                inbound_id=inbound_id,
+                xui_client_id=c["id"],
+                xui_email=c["email"],
+                claimed=False,
+            )
+            for c in clients
+        )
+        await session.commit()
+
+    logger.info("Client pool: added %s clients to inbound %s", len(clients), inbound_id)
+    return len(clients)
+
+
+async def refill_pool_loop():
+    while True:
+        for inbound_id in _pool_inbounds():
+            try:
+                await refill_inbound(inbound_id)
+            except Exception as e:
+                logger.warning("Client pool refill failed for inbound %s: %s", inbound_id, e)
+
+        _refill_event.clear()
+        try:
+            await asyncio.wait_for(
+                _refill_event.wait(),
+                timeout=settings.CLIENT_POOL_REFILL_INTERVAL_SECONDS,
+            )
+        except asyncio.TimeoutError:
+            pass
+
+
+def request_refill() -> None:
+    if _refill_event is not None:
+        _refill_event.set()
+
+
+def start_client_pool():
+    global _refill_event, _refill_task
+    if settings.CLIENT_POOL_SIZE <= 0:
+        return
+
+    _refill_event = asyncio.Event()
+    _refill_task = asyncio.create_task(refill_pool_loop())
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from config import settings
+from db.models import Subscription
+from db.repo_subs import deactivate_subscriptions, get_expired_subscriptions_page
+from services.metrics import register_gauges
+from services.xui_client import XuiClientNotFound, delete_xui_client
+
+logger = logging.getLogger("expiry_sweeper")
+
+last_sweep_stats: dict[str, float] = {}
+
+register_gauges("kynix_expiry_sweep", "Последний проход expiry sweeper", lambda: last_sweep_stats)
+
+
+async def _remove_client(sub: Subscription, slots: asyncio.Semaphore) -> bool:
+    """True, если клиента в 3x-ui больше нет (удалили сейчас или его уже не было)."""
+    if not sub.xui_client_id:
+        # старые подписки без UUID: email у них — fake_id пользователя, по нему
+        # нашёлся бы его текущий (возможно, только что оплаченный) клиент.
+        # Такие строки только деактивируем
+        return True
+
+    async with slots:
+        try:
+            await delete_xui_client(
+                inbound_id=int(settings.XUI_INBOUND_ID),
+                client_uuid=sub.xui_client_id,
+            )
+            return True
+        except XuiClientNotFound:
+            return True
+        except Exception as e:
+            logger.warning("Failed to delete expired X-UI client sub=%s: %s", sub.id, e)
+            return False
+
+
+async def sweep_expired_subscriptions() -> dict[str, float]:
+    """
+    Один проход: постранично выбирает истёкшие активные подписки,
+    удаляет их клиентов в 3x-ui (не больше EXPIRY_SWEEP_CONCURRENCY одновременно)
+    и деактивирует одним UPDATE те, чьих клиентов больше нет.
+    Подписки с неудавшимся удалением остаются активными до следующего прохода.
+    """
+    started = time.monotonic()
+    now = datetime.utcnow()
+    slots = asyncio.Semaphore(max(1, settings.EXPIRY_SWEEP_CONCURRENCY))
+
+    after = None
+    stats = {"batches": 0, "deactivated": 0, "xui_deleted": 0, "xui_failed": 0}
+
+    while True:
+        page = await get_expired_subscriptions_page(
+            now, after, settings.EXPIRY_SWEEP_BATCH_SIZE
+        )
+        if not page:
+            break
+
+        results = await asyncio.gather(*(_remove_client(sub, slots) for sub in page))
+        stats["xui_deleted"] += sum(results)
+        stats["xui_failed"] += len(results) - sum(results)
+
+        removed = [sub.id for sub, ok in zip(page, results) if ok]
+        stats["deactivated"] += await deactivate_subscriptions(removed)
+        stats["batches"] += 1
+
+        last = page[-1]
+        after = (last.expires_at, last.id)
+
+        if len(page) < settings.EXPIRY_SWEEP_BATCH_SIZE:
+            break
+
+    stats["duration_seconds"] = round(time.monotonic() - started, 3)
+    last_sweep_stats.clear()
+    last_sweep_stats.update(stats)
+
+    logger.info(
+        "Expiry sweep: deactivated=%s xui_deleted=%s xui_failed=%s batches=%s in %.3fs",
+        stats["deactivated"],
+        stats["xui_deleted"],
+        stats["xui_failed"],
+        stats["batches"],
+        stats["duration_seconds"],
+    )
+    return stats
+
+
+async def expiry_sweeper_loop():
+    while True:
+        try:
+            await sweep_expired_subscriptions()
+        except Exception:
+            logger.exception("Expiry sweep failed")
+        await asyncio.sleep(settings.EXPIRY_SWEEP_INTERVAL_SECONDS)
+
+
+def start_expiry_sweeper():
+    asyncio.create_task(expiry_sweeper_loop())
@@ -0,0 +1,210 @@
+import bisect
+import logging
+import re
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+logger = logging.getLogger("metrics")
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _labels_text(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        for values, v in self._values.items():
+            lines.append(f"{self.name}{_labels_text(self.labels, values)} {v}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [counts по бакетам..., +Inf], sum
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self._series.get(label_values)
+        if series is None:
+            series = ([0] * (len(self.buckets) + 1), [0.0])
+            self._series[label_values] = series
+        counts, total = series
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    @contextmanager
+    def time(self, *label_values: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for values, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = _labels_text(self.labels, values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            cumulative += counts[-1]
+            le = _labels_text(self.labels, values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labels, values)} {total[0]}")
+            lines.append(f"{self.name}_count{_labels_text(self.labels, values)} {cumulative}")
+        return lines
+
+
+_metrics: list[Counter | Histogram] = []
+# имя -> функция, возвращающая {метка: значение}; вызываются при каждом scrape
+_gauges: dict[str, tuple[str, Callable[[], dict[str, float]]]] = {}
+
+
+def counter(name: str, doc: str, labels: tuple[str, ...] = ()) -> Counter:
+    m = Counter(name, doc, labels)
+    _metrics.append(m)
+    return m
+
+
+def histogram(name: str, doc: str, labels: tuple[str, ...] = ()) -> Histogram:
+    m = Histogram(name, doc, labels)
+    _metrics.append(m)
+    return m
+
+
+def register_gauges(name: str, doc: str, collect: Callable[[], dict[str, float]]) -> None:
+    """Gauge с меткой "key" по каждому ключу словаря, который вернёт collect()."""
+    _gauges[name] = (doc, collect)
+
+
+def render_metrics() -> str:
+    lines = []
+    for m in _metrics:
+        lines.extend(m.render())
+    for name, (doc, collect) in _gauges.items():
+        try:
+            values = collect()
+        except Exception as e:
+            logger.warning("Gauge %s failed: %s", name, e)
+            continue
+        lines.append(f"# HELP {name} {doc}")
+        lines.append(f"# TYPE {name} gauge")
+        for key, v in values.items():
+            lines.append(f'{name}{{key="{_escape(key)}"}} {float(v)}')
+    return "\n".join(lines) + "\n"
+
+
+_ID_SEGMENT = re.compile(r"/(\d+|[0-9a-fA-F-]{32,36})(?=/|$)")
+
+
+def normalize_path(path: str) -> str:
+    """/panel/api/inbounds/3/delClient/<uuid> -> /panel/api/inbounds/:id/delClient/:id"""
+    return _ID_SEGMENT.sub("/:id", path)
+
+
+# ============================
+# Метрики бота
+# ============================
+
+handler_latency = histogram(
+    "kynix_handler_seconds",
+    "Время обработки апдейта хэндлером",
+    ("router", "handler"),
+)
+handler_errors = counter(
+    "kynix_handler_errors_total",
+    "Исключения в хэндлерах",
+    ("router", "handler"),
+)
+update_latency = histogram(
+    "kynix_update_seconds",
+    "Полное время обработки апдейта диспетчером",
+    ("update_type",),
+)
+hash_latency = histogram(
+    "kynix_hash_tg_id_seconds",
+    "hash_tg_id_async, включая ожидание в очереди пула",
+)
+hash_rejected = counter(
+    "kynix_hash_rejected_total",
+    "Вызовы hash_tg_id_async, отклонённые из-за полной очереди",
+)
+db_query_latency = histogram(
+    "kynix_db_query_seconds",
+    "Время SQL-запросов",
+    ("statement",),
+)
+xui_latency = histogram(
+    "kynix_xui_request_seconds",
+    "Запросы к 3x-ui",
+    ("method", "path", "status"),
+)
+
+
+# ============================
+# HTTP endpoint
+# ============================
+
+async def _metrics_handler(_):
+    from aiohttp import web
+
+    return web.Response(
+        text=render_metrics(),
+        content_type="text/plain",
+        headers={"X-Content-Type-Options": "nosniff"},
+    )
+
+
+_runner = None
+
+
+async def start_metrics_server(host: str, port: int) -> None:
+    from aiohttp import web
+
+    global _runner
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    _runner = web.AppRunner(app)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+    logger.info("Metrics endpoint on http://%s:%s/metrics", host, port)
+
+
+async def stop_metrics_server() -> None:
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
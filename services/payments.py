@@ -5,9 +5,12 @@ from aiogram import Bot
 from aiogram.types import LabeledPrice, PreCheckoutQuery, Message
 
 from config import settings
-from db.base import async_session
-from db.models import Subscription, User
-from services.xui_client import create_client_for_user, XuiError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import User
+from db.repo_subs import create_subscription
+from services.sender import notify_admins
+from services.xui_client import XuiError
 
 
 @dataclass
@@ -32,32 +35,28 @@ def build_prices(tariff: Tariff) -> List[LabeledPrice]:
     return [LabeledPrice(label=tariff.title, amount=tariff.stars_amount)]
 
 
-async def handle_successful_payment(bot: Bot, message: Message, user: User, tariff: Tariff):
+async def handle_successful_payment(
+    bot: Bot,
+    message: Message,
+    user: User,
+    tariff: Tariff,
+    session: AsyncSession | None = None,
+):
     """
     Вызывается:
       — либо после real successful_payment
       — либо из /testbuy для имитации покупки
     """
     try:
-        xui_data = await create_client_for_user(user.fake_id, days=tariff.days)
-
-        config_text = xui_data["vless"]
-        client_id = xui_data.get("clientId")
-        email = xui_data.get("email")
-
+        # через create_subscription, чтобы запись сбросила кэш профиля
+        sub = await create_subscription(user.id, tariff.days, session=session)
     except XuiError as e:
-        from config import settings as _s
-
         text_admin = (
             "❗ Ошибка 3x-ui\n"
             f"FAKE ID: {user.fake_id}\n"
             f"Ошибка: {e}\n"
         )
-        for admin_id in _s.ADMINS:
-            try:
-                await bot.send_message(admin_id, text_admin)
-            except Exception:
-                pass
+        notify_admins(text_admin)
 
         await message.answer(
             "Произошла ошибка при выдаче VPN-конфига. "
@@ -65,17 +64,12 @@ async def handle_successful_payment(bot: Bot, message: Message, user: User, tari
         )
         return
 
-    async with async_session() as session:
-        sub = Subscription(
-            user_id=user.id,
-            active=True,
-            xui_client_id=str(client_id) if client_id else None,
-            xui_email=email,
-            xui_config=config_text,
-        )
-        session.add(sub)
+    if session is not None:
+        # фиксируем до того, как отдать конфиг пользователю
         await session.commit()
 
+    config_text = sub.xui_config
+
     await message.answer(
  "✅ Подписка активирована!\n"
         "Вот ваш VPN-конфиг:\n\n"
@@ -84,15 +78,9 @@ async def handle_successful_payment(bot: Bot, message: Message, user: User, tari
         "- <a href=\"https://telegra.ph/Instrukciya-po-podklyucheniya-VPN-i-prilozheniya-06-23\">Инструкция по подключению Kynix VPN и приложения</a>"
     )
 
-    from config import settings as _s
-
     text_admin = (
         "💸 Успешная (в том числе тестовая) выдача конфига\n"
         f"FAKE ID: {user.fake_id}\n"
         f"Тариф: {tariff.title}\n"
     )
-    for admin_id in _s.ADMINS:
-        try:
-            await bot.send_message(admin_id, text_admin)
-        except Exception:
-            pass
+    notify_admins(text_admin)
@@ -1,5 +1,4 @@
 import asyncio
-import aiohttp
 import sys
 import logging
 
@@ -7,6 +6,7 @@ from config import settings
 from services.xui_client import delete_xui_client
 from db.base import async_session
 from db.models import User, Subscription
+from db.repo_subs import invalidate_profile
 from sqlalchemy import select
 
 
@@ -22,6 +22,9 @@ async def refund_stars(user_id: int, charge_id: str, token: str | None = None):
     charge_id – telegram_payment_charge_id
     token    – токен бота, если None -> берём из settings.BOT_TOKEN
     """
+    # aiohttp нужен только для возвратов — не тянем его при старте бота
+    import aiohttp
+
     if token is None:
         token = settings.BOT_TOKEN
 
@@ -61,6 +64,7 @@ async def remove_user_subscription(fake_id: int):
             select(Subscription)
             .where(Subscription.user_id == user.id, Subscription.active == True)  # noqa: E712
             .order_by(Subscription.id.desc())
+            .limit(1)
         )
         sub = res_sub.scalar_one_or_none()
 
@@ -68,9 +72,18 @@ async def remove_user_subscription(fake_id: int):
             return "No active subscription."
 
         # удаляем клиента из XUI
-        if sub.xui_email:
+        if sub.xui_client_id or sub.xui_email:
+            if sub.expires_at is None:
+                inbound_id = int(settings.XUI_INBOUND_ID_INF)
+            else:
+                inbound_id = int(settings.XUI_INBOUND_ID)
+
             try:
-                await delete_xui_client(sub.xui_email)
+                await delete_xui_client(
+                    email=sub.xui_email,
+                    inbound_id=inbound_id,
+                    client_uuid=sub.xui_client_id,
+                )
                 logger.info(f"Deleted XUI client {sub.xui_email}")
             except Exception as e:
                 logger.warning(f"XUI delete failed: {e}")
@@ -78,6 +91,7 @@ async def remove_user_subscription(fake_id: int):
         # деактивируем подписку
         sub.active = False
         await session.commit()
+        invalidate_profile(user.id)
 
         return "Subscription removed."
 
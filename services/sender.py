@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import settings
+
+logger = logging.getLogger("sender")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def block_for(self, seconds: float) -> None:
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class _Outgoing:
+    chat_id: int
+    text: str
+    kwargs: dict = field(default_factory=dict)
+    attempts: int = 0
+
+
+class MessageSender:
+    """
+    Очередь исходящих сообщений: общий token bucket на бота,
+    минимальный интервал на чат и обработка 429 (retry_after).
+    """
+
+    def __init__(self, bot: Bot, workers: int, rate: float, per_chat_interval: float):
+        self.bot = bot
+        self.per_chat_interval = per_chat_interval
+        self._bucket = TokenBucket(rate=rate, capacity=rate)
+        self._queue: asyncio.Queue[_Outgoing] = asyncio.Queue()
+        self._chat_next: dict[int, float] = {}
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(max(1, workers))]
+
+    def enqueue(self, chat_id: int, text: str, **kwargs) -> None:
+        self._queue.put_nowait(_Outgoing(chat_id, text, kwargs))
+
+    async def _wait_chat_slot(self, chat_id: int) -> None:
+        now = time.monotonic()
+        next_at = self._chat_next.get(chat_id, 0.0)
+        self._chat_next[chat_id] = max(now, next_at) + self.per_chat_interval
+        if next_at > now:
+            await asyncio.sleep(next_at - now)
+
+    async def _worker(self) -> None:
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._wait_chat_slot(item.chat_id)
+                await self._bucket.acquire()
+                await self.bot.send_message(item.chat_id, item.text, **item.kwargs)
+            except TelegramRetryAfter as e:
+                item.attempts += 1
+                self._bucket.block_for(e.retry_after)
+                if item.attempts <= settings.SEND_MAX_RETRIES:
+                    logger.info("Flood wait %ss for chat %s, retrying", e.retry_after, item.chat_id)
+                    self._queue.put_nowait(item)
+                else:
+                    logger.warning("Dropping message to %s after %s flood waits", item.chat_id, item.attempts)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Failed to send message to %s: %s", item.chat_id, e)
+            finally:
+                self._queue.task_done()
+                if len(self._chat_next) > 10000:
+                    now = time.monotonic()
+                    self._chat_next = {
+                        k: v for k, v in self._chat_next.items() if v > now
+                    }
+
+    async def close(self, drain_timeout: float | None = None) -> None:
+        if drain_timeout:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Sender closed with %s undelivered messages", self._queue.qsize())
+
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+
+_sender: MessageSender | None = None
+
+
+def start_sender(bot: Bot, rate: float | None = None) -> MessageSender:
+    global _sender
+    if _sender is None:
+        _sender = MessageSender(
+            bot,
+            workers=settings.SEND_WORKERS,
+            rate=rate or settings.SEND_RATE_PER_SECOND,
+            per_chat_interval=settings.SEND_PER_CHAT_INTERVAL_SECONDS,
+        )
+    return _sender
+
+
+async def stop_sender(drain_timeout: float | None = 5.0) -> None:
+    global _sender
+    if _sender is not None:
+        await _sender.close(drain_timeout)
+        _sender = None
+
+
+def send_message(chat_id: int, text: str, **kwargs) -> None:
+    if _sender is None:
+        logger.warning("Sender is not started, message to %s dropped", chat_id)
+        return
+    _sender.enqueue(chat_id, text, **kwargs)
+
+
+def notify_admins(text: str, **kwargs) -> None:
+    for admin_id in settings.ADMINS:
+        send_message(admin_id, text, **kwargs)
@@ -1,17 +1,28 @@
+import asyncio
 import logging
-import httpx
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
 import uuid
 import time
 import json
 from config import settings
+from services.metrics import normalize_path, xui_latency
+
+# httpx импортируется при создании сессии: на старте он не нужен
+if TYPE_CHECKING:
+    import httpx
 
 logger = logging.getLogger("xui_client")
 
 
 class XuiError(Exception):
     pass
+
+
+class XuiClientNotFound(XuiError):
+    """Клиента уже нет в inbound'е."""
     
-async def xui_login(client: httpx.AsyncClient):
+async def xui_login(client: "httpx.AsyncClient"):
     resp = await client.post(
         "/login",
         data={"username": settings.XUI_USERNAME, "password": settings.XUI_PASSWORD},
@@ -20,7 +31,127 @@ async def xui_login(client: httpx.AsyncClient):
     if resp.status_code != 200:
         raise XuiError(f"Failed to login: {resp.text}")
 
-async def get_inbound(client: httpx.AsyncClient, inbound_id: int):
+
+class XuiSession:
+    """
+    Долгоживущая сессия к панели 3x-ui: один пул keep-alive соединений
+    и переиспользуемая cookie авторизации. Повторный логин — только
+    когда панель ответила 401 или редиректом на страницу входа.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        max_connections: int,
+        max_keepalive: int,
+        timeout: float,
+    ):
+        import httpx
+
+        self.base_url = base_url
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+        )
+        self._timeout = httpx.Timeout(timeout)
+        self._client: "httpx.AsyncClient | None" = None
+        self._login_lock = asyncio.Lock()
+        self._login_generation = 0
+
+    def _get_client(self) -> "httpx.AsyncClient":
+        if self._client is None or self._client.is_closed:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=self._limits,
+                timeout=self._timeout,
+            )
+            self._login_generation = 0
+        return self._client
+
+    async def _login(self, seen_generation: int) -> None:
+        async with self._login_lock:
+            # пока ждали лок, кто-то другой уже перелогинился
+            if self._login_generation != seen_generation:
+                return
+            client = self._get_client()
+            client.cookies.clear()
+            await xui_login(client)
+            self._login_generation += 1
+
+    async def request(self, method: str, url: str, **kwargs) -> "httpx.Response":
+        client = self._get_client()
+        generation = self._login_generation
+        if generation == 0:
+            await self._login(generation)
+            generation = self._login_generation
+
+        resp = await self._timed_request(client, method, url, **kwargs)
+        if resp.status_code == 401 or resp.is_redirect:
+            logger.info("3x-ui session expired, logging in again")
+            await self._login(generation)
+            resp = await self._timed_request(client, method, url, **kwargs)
+
+        return resp
+
+    @staticmethod
+    async def _timed_request(client: "httpx.AsyncClient", method: str, url: str, **kwargs) -> "httpx.Response":
+        started = time.perf_counter()
+        status = "error"
+        try:
+            resp = await client.request(method, url, follow_redirects=False, **kwargs)
+            status = str(resp.status_code)
+            return resp
+        finally:
+            xui_latency.observe(
+                time.perf_counter() - started, method, normalize_path(url), status
+            )
+
+    async def get(self, url: str, **kwargs) -> "httpx.Response":
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> "httpx.Response":
+        return await self.request("POST", url, **kwargs)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_session: XuiSession | None = None
+
+
+def get_xui_session() -> XuiSession:
+    global _session
+    if _session is None:
+        _session = XuiSession(
+            settings.XUI_BASE_URL,
+            max_connections=settings.XUI_POOL_MAX_CONNECTIONS,
+            max_keepalive=settings.XUI_POOL_MAX_KEEPALIVE,
+            timeout=settings.XUI_TIMEOUT_SECONDS,
+        )
+    return _session
+
+
+async def close_xui_session() -> None:
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+async def get_inbound(client: XuiSession, inbound_id: int):
+    resp = await client.get(f"/panel/api/inbounds/get/{inbound_id}")
+
+    if resp.status_code == 200:
+        j = resp.json()
+        if j.get("success", True) and j.get("obj"):
+            return j["obj"]
+
+    # старые версии панели не знают /get/{id}
     resp = await client.get("/panel/api/inbounds/list")
 
     if resp.status_code != 200:
@@ -32,6 +163,62 @@ async def get_inbound(client: httpx.AsyncClient, inbound_id: int):
 
     raise XuiError(f"Inbound {inbound_id} not found")
 
+
+@dataclass(frozen=True)
+class InboundMeta:
+    inbound_id: int
+    host: str
+    port: int
+    pbk: str
+    sid: str
+
+
+def parse_inbound_meta(inbound: dict) -> InboundMeta:
+    stream_obj = json.loads(inbound["streamSettings"])
+    reality = stream_obj["realitySettings"]
+
+    return InboundMeta(
+        inbound_id=inbound["id"],
+        host=inbound.get("listen") or inbound.get("address") or "localhost",
+        port=inbound["port"],
+        pbk=reality["settings"]["publicKey"],
+        sid=reality["shortIds"][0],
+    )
+
+
+_inbound_meta: dict[int, tuple[float, InboundMeta]] = {}
+_inbound_meta_lock = asyncio.Lock()
+
+
+async def get_inbound_meta(client: XuiSession, inbound_id: int) -> InboundMeta:
+    """
+    Параметры inbound'а для build_vless с кэшем на XUI_INBOUND_CACHE_TTL_SECONDS.
+    Кэш сбрасывается при ошибке addClient/updateClient (inbound мог измениться)
+    и админской командой /xui_reload.
+    """
+    item = _inbound_meta.get(inbound_id)
+    if item and item[0] > time.monotonic():
+        return item[1]
+
+    async with _inbound_meta_lock:
+        item = _inbound_meta.get(inbound_id)
+        if item and item[0] > time.monotonic():
+            return item[1]
+
+        meta = parse_inbound_meta(await get_inbound(client, inbound_id))
+        _inbound_meta[inbound_id] = (
+            time.monotonic() + settings.XUI_INBOUND_CACHE_TTL_SECONDS,
+            meta,
+        )
+        return meta
+
+
+def invalidate_inbound_cache(inbound_id: int | None = None) -> None:
+    if inbound_id is None:
+        _inbound_meta.clear()
+    else:
+        _inbound_meta.pop(inbound_id, None)
+
 def build_vless(uid, host, port, tag, fake_id, pbk, sid):
     return (
         f"vless://{uid}@{host}:{port}"
@@ -47,64 +234,184 @@ def build_vless(uid, host, port, tag, fake_id, pbk, sid):
         f"#Kynix-VPN-{tag}-{fake_id}"
     )
 
-async def create_xui_client(fake_id: int, expiry_ts: int, tag: str, inbound_id: int):
-    async with httpx.AsyncClient(base_url=settings.XUI_BASE_URL) as client:
-
-        await xui_login(client)
-
-        inbound = await get_inbound(client, inbound_id)
-
-        stream_obj = json.loads(inbound["streamSettings"])
-        reality = stream_obj["realitySettings"]
-
-        pbk = reality["settings"]["publicKey"]
-        sid = reality["shortIds"][0]
-
-        host = inbound.get("listen") or inbound.get("address") or "localhost"
-        port = inbound["port"]
-
-        uid = str(uuid.uuid4())
-        subid = uuid.uuid4().hex[:16]
-        email = f"{fake_id}"
-
-        client_js = {
-            "id": uid,
-            "email": email,
-            "enable": True,
-            "expiryTime": expiry_ts,
-            "limitIp": 0,
-            "totalGB": 0,
-            "tgId": 0,
-            "reset": 0,
-            "flow": "xtls-rprx-vision",
-        }
-
-        resp = await client.post(
-            "/panel/api/inbounds/addClient",
-            json={
-                "id": inbound_id,
-                "settings": json.dumps({"clients": [client_js]}, ensure_ascii=False),
-            },
-        )
+def build_client_js(uid: str, email: str, expiry_ts: int, enable: bool = True) -> dict:
+    return {
+        "id": uid,
+        "email": email,
+        "enable": enable,
+        "expiryTime": expiry_ts,
+        "limitIp": 0,
+        "totalGB": 0,
+        "tgId": 0,
+        "reset": 0,
+        "flow": "xtls-rprx-vision",
+    }
+
+
+async def add_clients(client: XuiSession, inbound_id: int, clients: list[dict]) -> None:
+    resp = await client.post(
+        "/panel/api/inbounds/addClient",
+        json={
+            "id": inbound_id,
+            "settings": json.dumps({"clients": clients}, ensure_ascii=False),
+        },
+    )
 
-        if resp.status_code != 200:
-            raise XuiError(f"addClient failed: {resp.text}")
+    if resp.status_code != 200:
+        invalidate_inbound_cache(inbound_id)
+        raise XuiError(f"addClient failed: {resp.text}")
 
+    try:
+        j = resp.json()
+    except ValueError:
+        j = None
+
+    if isinstance(j, dict) and not j.get("success", True):
+        invalidate_inbound_cache(inbound_id)
+        raise XuiError(f"addClient rejected: {resp.text}")
+
+
+async def update_xui_client(client_uuid: str, inbound_id: int, client_js: dict) -> None:
+    client = get_xui_session()
+    resp = await client.post(
+        f"/panel/api/inbounds/updateClient/{client_uuid}",
+        json={
+            "id": inbound_id,
+            "settings": json.dumps({"clients": [client_js]}, ensure_ascii=False),
+        },
+    )
+
+    if resp.status_code != 200:
+        invalidate_inbound_cache(inbound_id)
+        raise XuiError(f"updateClient failed: {resp.text}")
+
+    try:
+        j = resp.json()
+    except ValueError:
+        j = None
+
+    if isinstance(j, dict) and not j.get("success", True):
+        invalidate_inbound_cache(inbound_id)
+        raise XuiError(f"updateClient rejected: {resp.text}")
+
+    index = _email_index.get(inbound_id)
+    if index is not None:
+        index[str(client_js["email"])] = client_uuid
+
+
+class ProvisioningQueue:
+    """
+    Собирает addClient-запросы по inbound'ам в течение linger-окна
+    и отправляет их одним addClient со списком клиентов.
+    Каждый вызов submit() ждёт результата своего клиента.
+    """
+
+    def __init__(self, max_batch: int, linger_ms: int):
+        self.max_batch = max(1, max_batch)
+        self.linger = max(0, linger_ms) / 1000
+        self._pending: dict[int, list[tuple[dict, asyncio.Future]]] = {}
+        self._timers: dict[int, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, inbound_id: int, client_js: dict) -> None:
+        fut = asyncio.get_running_loop().create_future()
+        batch = self._pending.setdefault(inbound_id, [])
+        batch.append((client_js, fut))
+
+        if len(batch) >= self.max_batch:
+            self._flush(inbound_id)
+        elif inbound_id not in self._timers:
+            self._timers[inbound_id] = asyncio.get_running_loop().call_later(
+                self.linger, self._flush, inbound_id
+            )
+
+        await fut
+
+    def _flush(self, inbound_id: int) -> None:
+        timer = self._timers.pop(inbound_id, None)
+        if timer is not None:
+            timer.cancel()
+
+        batch = self._pending.pop(inbound_id, None)
+        if batch:
+            task = asyncio.create_task(self._send(inbound_id, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, inbound_id: int, batch: list[tuple[dict, asyncio.Future]]) -> None:
+        client = get_xui_session()
         try:
-            j = resp.json()
-            if isinstance(j, dict) and not j.get("success", True):
-                raise XuiError(f"addClient rejected: {resp.text}")
-        except:
-            pass
+            await add_clients(client, inbound_id, [c for c, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                _resolve(batch[0][1], e)
+                return
+
+            # один плохой клиент не должен валить весь батч — досылаем по одному
+            logger.warning(
+                "Batched addClient (%s clients) failed, retrying one by one: %s",
+                len(batch),
+                e,
+            )
+            for c, fut in batch:
+                try:
+                    await add_clients(client, inbound_id, [c])
+                except Exception as e_one:
+                    _resolve(fut, e_one)
+                else:
+                    _resolve(fut)
+            return
+
+        for _, fut in batch:
+            _resolve(fut)
+
+
+def _resolve(fut: asyncio.Future, exc: Exception | None = None) -> None:
+    if fut.done():
+        return
+    if exc is None:
+        fut.set_result(None)
+    else:
+        fut.set_exception(exc)
 
-        vless = build_vless(uid, host, port, tag, fake_id, pbk, sid)
 
-        return {
-            "uuid": uid,
-            "subId": subid,
-            "email": email,
-            "vless": vless,
-        }
+_provisioning_queue: ProvisioningQueue | None = None
+
+
+def get_provisioning_queue() -> ProvisioningQueue:
+    global _provisioning_queue
+    if _provisioning_queue is None:
+        _provisioning_queue = ProvisioningQueue(
+            max_batch=settings.XUI_BATCH_MAX_SIZE,
+            linger_ms=settings.XUI_BATCH_LINGER_MS,
+        )
+    return _provisioning_queue
+
+
+async def create_xui_client(fake_id: int, expiry_ts: int, tag: str, inbound_id: int):
+    client = get_xui_session()
+    meta = await get_inbound_meta(client, inbound_id)
+
+    uid = str(uuid.uuid4())
+    subid = uuid.uuid4().hex[:16]
+    email = f"{fake_id}"
+
+    client_js = build_client_js(uid, email, expiry_ts)
+
+    await get_provisioning_queue().submit(inbound_id, client_js)
+
+    index = _email_index.get(inbound_id)
+    if index is not None:
+        index[email] = uid
+
+    vless = build_vless(uid, meta.host, meta.port, tag, fake_id, meta.pbk, meta.sid)
+
+    return {
+        "uuid": uid,
+        "subId": subid,
+        "email": email,
+        "vless": vless,
+    }
 
 async def create_client_for_user(fake_id: int, days: int):
     expiry_ts = int(time.time() * 1000 + days * 86400 * 1000)
@@ -128,51 +435,80 @@ async def create_client_inf(fake_id: int):
         inbound_id=inbound_inf,
     )
 
-async def delete_xui_client(email: str, inbound_id: int | None = None):
+_email_index: dict[int, dict[str, str]] = {}
 
-    inbound_id = inbound_id or int(settings.XUI_INBOUND_ID)
 
-    async with httpx.AsyncClient(base_url=settings.XUI_BASE_URL) as client:
-        await xui_login(client)
+async def _build_email_index(client: XuiSession, inbound_id: int) -> dict[str, str]:
+    inbound = await get_inbound(client, inbound_id)
+    settings_obj = json.loads(inbound["settings"])
 
-        inbound = await get_inbound(client, inbound_id)
-        
-        settings_obj = json.loads(inbound["settings"])
-        clients = settings_obj.get("clients", [])
+    index = {}
+    for c in settings_obj.get("clients", []):
+        client_uuid = c.get("id") or c.get("uuid")
+        if client_uuid and c.get("email") is not None:
+            index[str(c["email"])] = client_uuid
 
-        client_to_delete = next(
-            (c for c in clients if str(c.get("email")) == str(email)),
-            None,
-        )
+    _email_index[inbound_id] = index
+    return index
 
-        if client_to_delete is None:
-            raise XuiError(f"Client {email} not found in inbound {inbound_id}")
 
-        client_uuid = client_to_delete.get("id") or client_to_delete.get("uuid")
-        if not client_uuid:
-            raise XuiError(
-                f"Client {email} in inbound {inbound_id} has no 'id'/'uuid' field"
-            )
-            
-        resp = await client.post(
-            f"/panel/api/inbounds/{inbound_id}/delClient/{client_uuid}"
-        )
+async def find_client_uuid(client: XuiSession, email: str, inbound_id: int) -> str:
+    """
+    email -> UUID по индексу, построенному один раз на снимок inbound'а.
+    Снимок перечитывается, только если email в нём не найден.
+    """
+    index = _email_index.get(inbound_id)
+    if index is None or str(email) not in index:
+        index = await _build_email_index(client, inbound_id)
 
-        if resp.status_code != 200:
-            raise XuiError(f"deleteClient failed: {resp.text}")
+    client_uuid = index.get(str(email))
+    if client_uuid is None:
+        raise XuiClientNotFound(f"Client {email} not found in inbound {inbound_id}")
+    return client_uuid
 
-        try:
-            j = resp.json()
 
-            if isinstance(j, dict) and not j.get("success", True):
-                raise XuiError(f"deleteClient rejected: {resp.text}")
-        except Exception:
+async def delete_xui_client(
+    email: str | None = None,
+    inbound_id: int | None = None,
+    client_uuid: str | None = None,
+):
+    """
+    Удаляет клиента из inbound'а. Если UUID известен (Subscription.xui_client_id) —
+    сразу delClient/{uuid}, без выкачивания списка клиентов.
+    """
+    inbound_id = inbound_id or int(settings.XUI_INBOUND_ID)
 
-            pass
+    client = get_xui_session()
 
-        logger.info(
-            "Deleted X-UI client email=%s uuid=%s inbound=%s",
-            email,
-            client_uuid,
-            inbound_id,
-        )
+    if not client_uuid:
+        if email is None:
+            raise XuiError("Either client_uuid or email is required")
+        client_uuid = await find_client_uuid(client, email, inbound_id)
+
+    resp = await client.post(
+        f"/panel/api/inbounds/{inbound_id}/delClient/{client_uuid}"
+    )
+
+    if resp.status_code != 200:
+        raise XuiError(f"deleteClient failed: {resp.text}")
+
+    try:
+        j = resp.json()
+    except ValueError:
+        j = None
+
+    if isinstance(j, dict) and not j.get("success", True):
+        if "not found" in str(j.get("msg", "")).lower():
+            raise XuiClientNotFound(f"deleteClient: {resp.text}")
+        raise XuiError(f"deleteClient rejected: {resp.text}")
+
+    index = _email_index.get(inbound_id)
+    if index is not None and email is not None:
+        index.pop(str(email), None)
+
+    logger.info(
+        "Deleted X-UI client email=%s uuid=%s inbound=%s",
+        email,
+        client_uuid,
+        inbound_id,
+    )
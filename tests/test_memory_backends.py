@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+
+from security.memory_backends import InProcessBackend, MemoryBackend, RedisBackend, RespError
+
+
+class FakeRespServer:
+    """Крошечный RESP-сервер: AUTH, SELECT, SET, MGET, DEL с задержкой по ключу."""
+
+    def __init__(self, password: str | None = None):
+        self.password = password
+        self.data: dict[bytes, bytes] = {}
+        self.slow_keys: set[bytes] = set()
+        self.connections = 0
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}127.0.0.1:{port}/0"
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> list[bytes] | None:
+        line = await reader.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    @staticmethod
+    def _bulk(value: bytes | None) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    async def _handle(self, reader, writer) -> None:
+        self.connections += 1
+        authed = self.password is None
+        try:
+            while (args := await self._read_command(reader)) is not None:
+                cmd, rest = args[0].upper(), args[1:]
+                if cmd == b"AUTH":
+                    authed = rest[0].decode() == self.password
+                    writer.write(b"+OK\r\n" if authed else b"-WRONGPASS invalid password\r\n")
+                elif not authed:
+                    writer.write(b"-NOAUTH Authentication required.\r\n")
+                elif cmd == b"SELECT":
+                    writer.write(b"+OK\r\n")
+                elif cmd == b"SET":
+                    self.data[rest[0]] = rest[1]
+                    writer.write(b"+OK\r\n")
+                elif cmd == b"MGET":
+                    if self.slow_keys.intersection(rest):
+                        await asyncio.sleep(0.2)
+                    writer.write(
+                        b"*%d\r\n" % len(rest) + b"".join(self._bulk(self.data.get(k)) for k in rest)
+                    )
+                elif cmd == b"DEL":
+                    writer.write(b":%d\r\n" % sum(self.data.pop(k, None) is not None for k in rest))
+                else:
+                    writer.write(b"-ERR unknown command\r\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+TTLS = {"user": 60, "support": 60}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_abstract_backend_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        MemoryBackend()
+
+
+def test_in_process_backend_roundtrip():
+    async def scenario():
+        backend = InProcessBackend(TTLS, max_size=10)
+        await backend.set("support", 1, 100)
+        assert await backend.get(1, "user", "support") == 100
+        await backend.delete("support", 1)
+        assert await backend.get(1, "user", "support") is None
+
+    run(scenario())
+
+
+def test_redis_backend_roundtrip():
+    async def scenario():
+        server = FakeRespServer()
+        backend = RedisBackend(await server.start(), TTLS)
+        try:
+            await backend.set("user", 1, 100)
+            await backend.set("support", 2, 200)
+            assert await backend.get(1, "user", "support") == 100
+            assert await backend.get(2, "user", "support") == 200
+            await backend.delete("support", 2)
+            assert await backend.get(2, "user", "support") is None
+        finally:
+            await backend.close()
+            await server.stop()
+
+    run(scenario())
+
+
+def test_failed_auth_drops_connection():
+    async def scenario():
+        server = FakeRespServer(password="secret")
+        url = (await server.start()).replace("secret", "wrong")
+        backend = RedisBackend(url, TTLS)
+        try:
+            with pytest.raises(RespError):
+                await backend.set("user", 1, 100)
+            assert backend.client._writer is None
+            assert server.data == {}
+        finally:
+            await backend.close()
+            await server.stop()
+
+    run(scenario())
+
+
+def test_cancelled_command_does_not_leak_reply():
+    async def scenario():
+        server = FakeRespServer()
+        backend = RedisBackend(await server.start(), TTLS)
+        try:
+            await backend.set("user", 1, 100)
+            await backend.set("user", 2, 200)
+            server.slow_keys.add(b"kynix:user:1")
+
+            task = asyncio.create_task(backend.get(1, "user"))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+            # ответ на отменённый MGET не должен достаться следующей команде
+            assert await backend.get(2, "user") == 200
+            assert server.connections == 2
+        finally:
+            await backend.close()
+            await server.stop()
+
+    run(scenario())